@@ -31,6 +31,10 @@ class OptimizerName(enum.Enum):
     QNG_FUBINI_STUDY_HESSIAN = 'qng_fubini_study_hessian'
     QNG_FUBINI_STUDY_SCHEDULER = 'qng_fubini_study_scheduler'
     QNG_QFIM = 'qng_qfim'
+# Gradient method of the loss function
+class GradientMethod(enum.Enum):
+    PSR = 'psr'
+    ADJOINT = 'adjoint'
     
 class MetricName(enum.Enum):
     LOSS_BASIC = 'loss_basic'
@@ -62,6 +66,7 @@ GAMMA = 0.7  # learning rate decay rate
 DELTA = 0.01  # minimum change value of loss value
 DISCOUNTING_FACTOR = 0.3  # In [0, 1]
 BETA1, BETA2, EPSILON = 0.8, 0.999, 10 ** (-8) # adam hyper-parameters
+QNG_REGULARIZATION = 10 ** (-3) # added to the diagonal of the QNG metric tensor
 # Logger
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
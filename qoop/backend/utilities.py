@@ -1,4 +1,6 @@
+import io
 import typing
+import hashlib
 import qiskit
 import scipy
 import tqdm
@@ -277,6 +279,33 @@ def load_circuit(file_name: str) -> qiskit.QuantumCircuit:
         qc = qpy.load(qpy_file_read)[0]
     return qc
 
+
+def circuit_to_bytes(qc: qiskit.QuantumCircuit) -> bytes:
+    """Serialize circuit as compact qpy bytes
+
+    Args:
+        qc (qiskit.QuantumCircuit)
+
+    Returns:
+        bytes
+    """
+    buffer = io.BytesIO()
+    qpy.dump(qc, buffer)
+    return buffer.getvalue()
+
+
+def circuit_from_bytes(data: bytes) -> qiskit.QuantumCircuit:
+    """Deserialize circuit from qpy bytes
+
+    Args:
+        data (bytes)
+
+    Returns:
+        qiskit.QuantumCircuit
+    """
+    return qpy.load(io.BytesIO(data))[0]
+
+
 def unit_vector(i: int, length: int) -> np.ndarray:
     """Create vector where a[i] = 1 and a[j] = 0 with j <> i
 
@@ -401,6 +430,45 @@ def compose_circuit(qcs: typing.List[qiskit.QuantumCircuit]) -> qiskit.QuantumCi
             qc.append(instruction[0], instruction[1])
     return qc
 
+def circuit_key(qc: qiskit.QuantumCircuit) -> str:
+    """Canonical hash of the circuit structure (gate sequence + qubit operands).
+    Parameters are replaced by their position in qc.parameters, so two circuits
+    which differ only by parameter names (ex: after compose_circuit) share the same key.
+
+    Args:
+        - qc (qiskit.QuantumCircuit)
+
+    Returns:
+        - str: hex digest
+    """
+    canonical_parameters = {
+        parameter: qiskit.circuit.Parameter(f'_{index}')
+        for index, parameter in enumerate(qc.parameters)
+    }
+    # Parameters missing from the parameter table (ex: qc.data edited in place) are numbered by appearance
+    for instruction in qc.data:
+        for param in instruction.operation.params:
+            if isinstance(param, qiskit.circuit.ParameterExpression):
+                for p in param.parameters:
+                    if p not in canonical_parameters:
+                        canonical_parameters[p] = qiskit.circuit.Parameter(f'_{len(canonical_parameters)}')
+    tokens = [str(qc.num_qubits)]
+    for instruction in qc.data:
+        operation = instruction.operation
+        qubits = [qc.find_bit(qubit).index for qubit in instruction.qubits]
+        params = []
+        for param in operation.params:
+            if isinstance(param, qiskit.circuit.ParameterExpression):
+                param = param.subs(
+                    {p: canonical_parameters[p] for p in param.parameters})
+                params.append(str(param))
+            elif isinstance(param, (int, float, complex, np.number, np.ndarray)):
+                params.append(str(np.round(param, 10)))
+            else:
+                params.append(str(param))
+        tokens.append(f"{operation.name}{qubits}{params}")
+    return hashlib.sha1(';'.join(tokens).encode()).hexdigest()
+
 def normalize_circuit(qc: qiskit.QuantumCircuit) -> qiskit.QuantumCircuit:    
     return compose_circuit([qc])
 
@@ -137,24 +137,18 @@ class QuantumCompilation():
                     'The metric function must be a function f: u, vdagger, thetas -> metric value or string in qsee.core.metric or self-define')
         return
 
-    def set_optimizer(self, _optimizer: types.FunctionType | str) -> int:
+    def set_optimizer(self, _optimizer: optimizer.Optimizer | types.FunctionType | str) -> int:
         """Change the optimizer of the compiler.
 
         Args:
-            - _optimizer (types.FunctionType | str)
+            - _optimizer (optimizer.Optimizer | types.FunctionType | str): optimizer object, name in constant.OptimizerName, function of qoop.core.optimizer or f(thetas, grad_loss) -> thetas
 
         Raises:
             - ValueError: when you pass wrong type
         Returns:
             - int: 1 means success
         """
-        if callable(_optimizer):
-            self.optimizer = _optimizer
-        elif isinstance(_optimizer, str):
-            self.optimizer = getattr(optimizer, _optimizer)
-        else:
-            raise ValueError(
-                'The optimizer must be a function f: thetas -> thetas or string in qsee.core.optimizer or self-define')
+        self.optimizer = optimizer.get_optimizer(_optimizer)
         return 1
 
     def set_num_steps(self, _num_steps: int) -> int:
@@ -235,14 +229,10 @@ class QuantumCompilation():
         # constant.PSI = psi
         constant.UVDAGGER = self.u.compose(self.vdagger, inplace=False)
         constant.MEASURE_MODE = constant.MeasureMode.SIMULATE.value
+        adam = optimizer.Adam()
         for i in range(0, num_steps):
             grad_loss = gradient.grad_loss(self.u, self.thetas)
-            if i == 0:
-                m, v1 = list(np.zeros(self.thetas.shape[0])), list(
-                    np.zeros(self.thetas.shape[0]))
-            optimizer_params = [m, v1, i, grad_loss]
-
-            self.thetas = optimizer.adam(self.thetas, *optimizer_params)
+            self.thetas = adam.step(self.thetas, grad_loss)
             self.thetass.append(self.thetas.copy())
             if verbose == 1:
                 bar.update(1)
@@ -255,13 +245,14 @@ class QuantumCompilation():
         # Delete psi file
         return self    
 
-    def fit(self, num_steps: int = 100, verbose: int = 0):
+    def fit(self, num_steps: int = 100, verbose: int = 0, gradient_method: str = constant.GradientMethod.PSR.value):
         """Optimize the thetas parameters
 
         Args:
             - num_steps: number of iterations
             - verbose (int, optional): 0, 1, or 2. Verbosity mode. 0 = silent, 1 = progress bar, 2 = one line per 10 steps. Verbose 1 is good for timing training time, verbose 2 if you want to log loss values to a file. Please install package tdqm if you want to use verbose 1. 
             - metrics (List[str]): list of metric name that you want, take example, ['compilation', 'gibbs']
+            - gradient_method (str, optional): 'psr' (parameter-shift rule) or 'adjoint' (adjoint differentiation, one forward and one backward pass for all parameters). Defaults to 'psr'.
         Returns:
             - QuantumCompilation: self
         """
@@ -277,42 +268,11 @@ class QuantumCompilation():
         if verbose == 1:
             bar = utilities.ProgressBar(max_value=num_steps, disable=False)
         uvaddager = self.u.compose(self.vdagger)
+        grad_loss_func = gradient.get_grad_loss_func(gradient_method)
+        self.optimizer.reset()
         for i in range(0, num_steps):
-            grad_loss = gradient.grad_loss(uvaddager, self.thetas)
-            optimizer_name = self.optimizer.__name__
-            if optimizer_name == constant.OptimizerName.SGD.value:
-                optimizer_params = [grad_loss]
-            elif optimizer_name == constant.OptimizerName.ADAM.value:
-                if i == 0:
-                    m, v1 = list(np.zeros(self.thetas.shape[0])), list(
-                        np.zeros(self.thetas.shape[0]))
-                optimizer_params = [m, v1, i, grad_loss]
-
-            elif 'qng' in optimizer_name:
-                grad_psi1 = gradient.grad_psi(uvaddager, self.thetas,
-                                            r=1 / 2,
-                                            s=np.pi)
-                qc_binded = uvaddager.assign_parameters(self.thetas)
-                psi = qi.Statevector.from_instruction(qc_binded).data
-                psi = np.expand_dims(psi, 1)
-                if optimizer_name == constant.OptimizerName.QNG_FUBINI_STUDY.value:
-                    G = gradient.qng(qc_binded)
-                    optimizer_params = [G, grad_loss]
-                if optimizer_name == constant.OptimizerName.QNG_FUBINI_STUDY_HESSIAN.value:
-                    G = gradient.qng_hessian(uvaddager)
-                    optimizer_params = [G, grad_loss]
-                if optimizer_name == constant.OptimizerName.QNG_FUBINI_STUDY_SCHEDULER.value:
-                    G = gradient.qng(uvaddager)
-                    optimizer_params = [G, i, grad_loss]
-                if optimizer_name == constant.OptimizerName.QNG_QFIM.value:
-                    optimizer_params = [psi, grad_psi1, grad_loss]
-                if optimizer_name == constant.OptimizerName.QNG_ADAM.value:
-                    if i == 0:
-                        m, v1 = list(np.zeros(self.thetas.shape[0])), list(
-                            np.zeros(self.thetas.shape[0]))
-                    optimizer_params = [m, v1, i, psi, grad_psi1, grad_loss]
-            
-            self.thetas = self.optimizer(self.thetas, *optimizer_params)
+            grad_loss = grad_loss_func(uvaddager, self.thetas)
+            self.thetas = self.optimizer.step(self.thetas, grad_loss, uvaddager)
             self.thetass.append(self.thetas.copy())
             if verbose == 1:
                 bar.update(1)
@@ -3,8 +3,9 @@ import qiskit
 import qiskit.quantum_info as qi
 import numpy as np
 import typing
+import types
 import scipy
-from ..core import measure
+from ..core import measure, simulator
 from ..backend import utilities, constant
 
 
@@ -52,6 +53,40 @@ def single_4term_psr(qc: qiskit.QuantumCircuit, thetas: np.ndarray, i: int) -> f
 
 
 
+def psr_shifts(index_list: typing.List[int], thetas: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """All shifted parameter vectors of the parameter-shift rules, 2 per parameter of a
+    single-qubit gate (equation (13)) and 4 per parameter of a CRY gate (equation (14))
+
+    Args:
+        - index_list (typing.List[int]): see utilities.get_cry_index
+        - thetas (np.ndarray): P parameters
+
+    Returns:
+        - typing.Tuple[np.ndarray, np.ndarray]: (kP x P shifted parameters, P x kP coefficients),
+        the gradient of P_0 is coefficients @ P_0(shifted parameters)
+    """
+    shifts, rows, coefficients = [], [], []
+    for i, index in enumerate(index_list):
+        if index == 0:
+            terms = [(constant.two_term_psr['s'], constant.two_term_psr['r']),
+                     (-constant.two_term_psr['s'], -constant.two_term_psr['r'])]
+        else:
+            terms = [(constant.four_term_psr['alpha'], constant.four_term_psr['d_plus']),
+                     (-constant.four_term_psr['alpha'], -constant.four_term_psr['d_plus']),
+                     (constant.four_term_psr['beta'], -constant.four_term_psr['d_minus']),
+                     (-constant.four_term_psr['beta'], constant.four_term_psr['d_minus'])]
+        for shift, coefficient in terms:
+            shifts.append((i, shift))
+            rows.append(i)
+            coefficients.append(coefficient)
+    shifted_thetas = np.tile(thetas, (len(shifts), 1))
+    for k, (i, shift) in enumerate(shifts):
+        shifted_thetas[k, i] += shift
+    coefficient_matrix = np.zeros((len(thetas), len(shifts)))
+    coefficient_matrix[rows, np.arange(len(shifts))] = coefficients
+    return shifted_thetas, coefficient_matrix
+
+
 def grad_loss(qc: qiskit.QuantumCircuit, thetas: np.ndarray) -> np.ndarray:
     """Return the gradient of the loss function
 
@@ -59,24 +94,75 @@ def grad_loss(qc: qiskit.QuantumCircuit, thetas: np.ndarray) -> np.ndarray:
 
     => nabla_L = - nabla_P_0 = - r (P_0(+s) - P_0(-s))
 
+    All shifted circuits are evaluated by one measure.measure_batch call,
+    single_2term_psr and single_4term_psr give the same values one parameter at a time.
+
     Args:
         - qc (QuantumCircuit): Parameterized quantum circuit 
         - thetas (np.ndarray): Parameters
 
     Returns:
         - np.ndarray: the gradient vector
+
+    Raises:
+        - ValueError: if the number of parameters and of gates found by utilities.get_cry_index differ
     """
+    thetas = np.asarray(thetas, dtype=np.float64)
     index_list = utilities.get_cry_index(qc, thetas)
-    grad_loss = np.zeros(len(thetas))
+    if len(index_list) != len(thetas):
+        # A parameter without a gate would silently get a zero gradient
+        raise ValueError(
+            f'{len(thetas)} parameters are given but utilities.get_cry_index finds {len(index_list)} parameterized gates')
+    shifted_thetas, coefficients = psr_shifts(index_list, thetas)
+    return -coefficients @ measure.measure_batch(qc, shifted_thetas)
 
-    for i in range(0, len(thetas)):
-        if index_list[i] == 0:
-            # In equation (13)
-            grad_loss[i] = single_2term_psr(qc, thetas, i)
-        if index_list[i] == 1:
-            # In equation (14)
-            grad_loss[i] = single_4term_psr(qc, thetas, i)
-    return grad_loss
+
+def grad_loss_adjoint(qc: qiskit.QuantumCircuit, thetas: np.ndarray) -> np.ndarray:
+    """Same gradient as grad_loss, computed by adjoint differentiation (see
+    simulator.GateProgram.overlap_gradient) in O(gates) instead of O(P.gates).
+    It needs the state vector, so EXPERIMENT mode and circuits which the simulator
+    does not support use grad_loss.
+
+    THEORY: P_0 = |<0|psi>|^2 => nabla_P_0 = 2 Re(conj(a) nabla_a)
+
+    SIMULATE: P_0 = Re(<PSI|psi>)^2 => nabla_P_0 = 2 Re(a) Re(nabla_a)
+
+    Args:
+        - qc (QuantumCircuit): Parameterized quantum circuit
+        - thetas (np.ndarray): Parameters
+
+    Returns:
+        - np.ndarray: the gradient vector
+    """
+    program = None
+    if constant.MEASURE_MODE != constant.MeasureMode.EXPERIMENT.value:
+        program = simulator.get_program(qc)
+    if program is None:
+        return grad_loss(qc, thetas)
+    if constant.MEASURE_MODE == constant.MeasureMode.THEORY.value:
+        target = np.zeros(2**qc.num_qubits, dtype=np.complex128)
+        target[0] = 1
+        amplitude, grad_amplitude = program.overlap_gradient(thetas, target)
+        return -2 * np.real(np.conjugate(amplitude) * grad_amplitude)
+    amplitude, grad_amplitude = program.overlap_gradient(thetas, constant.PSI)
+    return -2 * np.real(amplitude) * np.real(grad_amplitude)
+
+
+def get_grad_loss_func(gradient_method: str) -> types.FunctionType:
+    """Gradient function of a constant.GradientMethod value
+
+    Args:
+        - gradient_method (str): 'psr' or 'adjoint'
+
+    Returns:
+        - types.FunctionType: f(qc, thetas) -> gradient vector
+    """
+    if gradient_method == constant.GradientMethod.PSR.value:
+        return grad_loss
+    if gradient_method == constant.GradientMethod.ADJOINT.value:
+        return grad_loss_adjoint
+    raise ValueError(
+        f'The gradient method must be one of {[method.value for method in constant.GradientMethod]}')
 
 
 def grad_psi(qc: qiskit.QuantumCircuit, thetas: np.ndarray, r: float, s: float):
@@ -91,6 +177,11 @@ def grad_psi(qc: qiskit.QuantumCircuit, thetas: np.ndarray, r: float, s: float):
     Returns:
         - np.ndarray: N -dimensional vector
     """
+    program = simulator.get_program(qc)
+    if program is not None:
+        # All shifted parameter vectors are simulated as one batch
+        shifted_thetas = np.tile(thetas, (len(thetas), 1)) + s * np.eye(len(thetas))
+        return r * np.expand_dims(program.run(shifted_thetas), 2)
     gradient_psi = []
     for i in range(0, len(thetas)):
         thetas_copy = thetas.copy()
@@ -114,21 +205,16 @@ def qfim(psi: np.ndarray, grad_psi: np.ndarray):
     Returns:
         - np.ndarray: N x N matrix
     """
-    num_params = grad_psi.shape[0]
-    # Calculate elements \bra\psi|\partial_k \psi\ket
-    F_elements = np.zeros(num_params, dtype=np.complex128)
-    for i in range(num_params):
-        F_elements[i] = np.transpose(np.conjugate(psi)) @ (grad_psi[i])
-    # Calculate F[i, j] = 4*Re*[\bra\partial_i \psi | \partial_j \psi \ket -
+    num_params = len(grad_psi)
+    # J: P x N matrix whose rows are \partial_k \psi
+    J = np.asarray(grad_psi).reshape(num_params, -1)
+    psi = np.asarray(psi).reshape(-1)
+    # Elements \bra\psi|\partial_k \psi\ket
+    F_elements = J @ np.conjugate(psi)
+    # F[i, j] = 4*Re*[\bra\partial_i \psi | \partial_j \psi \ket -
     # \bra\partial_i\psi | \psi\ket * \bra\psi|\partial_j \psi\ket]
-    F = np.zeros([num_params, num_params])
-    for i in range(0, num_params):
-        for j in range(0, num_params):
-            F[i, j] = 4 * np.real(
-                np.transpose(np.conjugate(grad_psi[i])) @ (grad_psi[j]) -
-                np.transpose(np.conjugate(F_elements[i])) * (F_elements[j]))
-            if F[i, j] < 10**(-15):
-                F[i, j] = 0
+    F = 4 * np.real(np.conjugate(J) @ J.T - np.outer(np.conjugate(F_elements), F_elements))
+    F[F < 10**(-15)] = 0
     return F
 
 
@@ -143,41 +229,28 @@ def calculate_g(qc: qiskit.QuantumCircuit, observers: typing.Dict[str, int]) ->
     Returns:
         - np.ndarray: block-diagonal submatrix g
     """
-    # Get |psi>
     psi = qi.Statevector(qc).data
-    psi = np.expand_dims(psi, 1)
-    # Get <psi|
-    psi_hat = np.transpose(np.conjugate(psi))
-    num_observers = len(observers)
     num_qubits = qc.num_qubits
-    g = np.zeros([num_observers, num_observers], dtype=np.complex128)
-    # Each K[j] must have 2^n x 2^n dimensional with n is the number of qubits
-    Ks = []
-    # Observer shorts from high to low
+    # Axis k of the tensor is the k-th factor of the Kronecker products, the most significant qubit first
+    psi_tensor = psi.reshape((2,) * num_qubits)
+    # Each K[j] is a 2 x 2 generator on its wire, and |1><1| on the other wires for controlled gates.
+    # K[j]|psi> is computed on the tensor, without the 2^n x 2^n operator
+    K_psis = []
     for observer_name, observer_wire in observers:
         observer = constant.generator[observer_name]
-        if observer_wire == 0:
-            K = observer
-        else:
-            if observer_name in ['crx', 'cry', 'crz', 'cz']:
-                K = constant.generator['11']
-            else:
-                K = constant.generator['i']
-        for i in range(1, num_qubits):
-            if i == observer_wire:
-                K = np.kron(K, observer)
-            else:
-                if observer_name in ['crx', 'cry', 'crz', 'cz']:
-                    K = np.kron(K, constant.generator['11'])
-                else:
-                    K = np.kron(K, constant.generator['i'])
-        Ks.append(K)
-    for i in range(0, num_observers):
-        for j in range(0, num_observers):
-            g[i, j] = psi_hat @ (Ks[i] @ Ks[j]) @ psi - (
-                psi_hat @ Ks[i] @ psi) * (psi_hat @ Ks[j] @ psi)
-            if g[i, j] < 10**(-10):
-                g[i, j] = 0
+        K_psi = np.moveaxis(np.tensordot(observer, psi_tensor, axes=([1], [observer_wire])), 0, observer_wire)
+        if observer_name in ['crx', 'cry', 'crz', 'cz']:
+            projected = np.zeros_like(K_psi)
+            index = tuple(slice(None) if wire == observer_wire else 1 for wire in range(num_qubits))
+            projected[index] = K_psi[index]
+            K_psi = projected
+        K_psis.append(K_psi.reshape(-1))
+    K_psis = np.array(K_psis).reshape(len(observers), 2**num_qubits)
+    # K[j] are Hermitian, so <psi|K[i] K[j]|psi> = (K[i]|psi>)^dagger K[j]|psi>
+    expectations = K_psis @ np.conjugate(psi)
+    g = np.conjugate(K_psis) @ K_psis.T - np.outer(expectations, expectations)
+    # Same as the comparison g[i, j] < 10**(-10) of complex numbers (real part first)
+    g[(g.real < 10**(-10)) | ((g.real == 10**(-10)) & (g.imag < 0))] = 0
     return g
 
 
@@ -186,64 +259,145 @@ def calculate_g(qc: qiskit.QuantumCircuit, observers: typing.Dict[str, int]) ->
 ######################################
 
 
-def qng_hessian(uvdagger: qiskit.QuantumCircuit, thetas: np.ndarray) -> np.ndarray:
-    """_summary_
+def qng_hessian(uvdagger: qiskit.QuantumCircuit, thetas: np.ndarray, batch_size: int = 256) -> np.ndarray:
+    """Fubini-Study metric as -1/2 the Hessian of the fidelity f(thetas') = |<psi(thetas)|psi(thetas')>|^2,
+    by central finite differences with step alpha:
+
+    G[i][j] = -1/2 (f(+i+j) - f(+i-j) - f(-i+j) + f(-i-j)) / (4 sin(alpha)^2)
+
+    G is symmetric, so only i <= j are evaluated, and f comes from the overlaps of state vectors
+    simulated in batches of shifted parameters.
 
     Args:
         - uvdagger (qiskit.QuantumCircuit): composed circuit
         - thetas (np.ndarray): parameters
+        - batch_size (int, optional): Number of state vectors simulated together. Defaults to 256.
 
     Returns:
         np.ndarray: G matrix
     """
     alpha = 0.01
+    thetas = np.asarray(thetas, dtype=np.float64)
     length = thetas.shape[0]
-    thetas_origin = thetas
-
-    def f(thetas):
-        qc = uvdagger.assign_parameters(thetas)
-        qc_reverse = uvdagger.assign_parameters(thetas_origin).inverse()
-        qc = qc.compose(qc_reverse)
-        return measure.measure(qc, list(range(qc.num_qubits)))
-    G = [[0 for _ in range(length)] for _ in range(length)]
-    for i in range(0, length):
-        for j in range(0, length):
-            k1 = f(thetas + alpha*(utilities.unit_vector(i,
-                   length) + utilities.unit_vector(j, length)))
-            k2 = -f(thetas + alpha * (utilities.unit_vector(i,
-                    length) - utilities.unit_vector(j, length)))
-            k3 = -f(thetas - alpha * (utilities.unit_vector(i,
-                    length) - utilities.unit_vector(j, length)))
-            k4 = f(thetas - alpha*(utilities.unit_vector(i,
-                   length) + utilities.unit_vector(j, length)))
-            G[i][j] = (1/(4*(np.sin(alpha))**2))*(k1 + k2 + k3 + k4)
-    return -1/2*np.asarray(G)
-
-
-def qng(uvaddger: qiskit.QuantumCircuit) -> np.ndarray:
-    """Calculate G matrix in qng
+    rows, columns = np.triu_indices(length)
+    # Shifts +i+j, +i-j, -i+j, -i-j of every pair i <= j, with the signs of the formula
+    identity = np.identity(length)
+    shifts = np.concatenate([
+        identity[rows] + identity[columns],
+        identity[rows] - identity[columns],
+        -identity[rows] + identity[columns],
+        -identity[rows] - identity[columns]])
+    signs = np.array([1, -1, -1, 1])
+    program = simulator.get_program(uvdagger)
+    if program is not None:
+        psi = program.run(thetas)[0]
+    else:
+        psi = qi.Statevector(uvdagger.assign_parameters(thetas)).data
+    fidelities = np.empty(shifts.shape[0])
+    for start in range(0, shifts.shape[0], batch_size):
+        shifted_thetas = thetas + alpha * shifts[start:start + batch_size]
+        if program is not None:
+            psis = program.run(shifted_thetas)
+        else:
+            psis = np.array([qi.Statevector(uvdagger.assign_parameters(shifted)).data
+                             for shifted in shifted_thetas])
+        fidelities[start:start + batch_size] = np.abs(psis @ np.conjugate(psi))**2
+    upper = signs @ fidelities.reshape(4, -1) / (4 * (np.sin(alpha))**2)
+    G = np.zeros((length, length))
+    G[rows, columns] = upper
+    G[columns, rows] = upper
+    return -1/2*G
+
+
+def _qng_layers(program: simulator.GateProgram, is_param: np.ndarray) -> typing.List[typing.Tuple[bool, typing.List[int]]]:
+    """Split the gates of a program into layers as utilities.split_into_layers: a new layer starts
+    when a gate shares a wire with the current layer or when the gate type (parameterized or not) changes
+
+    Returns:
+        - typing.List[typing.Tuple[bool, typing.List[int]]]: (is parameterized layer, gate positions)
+    """
+    layers = []
+    layer, wires, is_param_layer = [], set(), None
+    for g in range(len(program)):
+        gate_wires = {int(program.targets[g])}
+        if program.controls[g] >= 0:
+            gate_wires.add(int(program.controls[g]))
+        if g in program.matrices:
+            gate_wires.update(program.matrices[g][1])
+        if len(layer) > 0 and (len(gate_wires & wires) > 0 or is_param_layer != is_param[g]):
+            layers.append((is_param_layer, layer))
+            layer, wires = [], set()
+        is_param_layer = bool(is_param[g])
+        layer.append(g)
+        wires |= gate_wires
+    if len(layer) > 0:
+        layers.append((is_param_layer, layer))
+    return layers
+
+
+def qng(uvaddger: qiskit.QuantumCircuit, thetas: np.ndarray = None) -> np.ndarray:
+    """Calculate G matrix in qng, the block-diagonal Fubini-Study tensor. The state vector is
+    carried forward layer by layer and each block comes from the generators applied to the
+    state before its layer (see simulator.apply_generator), so the cost is linear in depth.
 
     Args:
         - uvdagger (qiskit.QuantumCircuit)
+        - thetas (np.ndarray, optional): parameters of uvdagger. If given, only gates of these parameters
+        are differentiated and G is a P x P matrix in the parameter order, except for circuits with non-linear
+        parameter expressions. Defaults to None, one row per rotation gate of a bound circuit.
 
     Returns:
         - np.ndarray: G matrix
     """
-    n = uvaddger.num_qubits
-    # List of g matrices
+    program = simulator.get_program(uvaddger)
+    if program is None:
+        # Final measurements do not change the metric, the gate order (so the layers) is kept
+        uvaddger = uvaddger.copy()
+        while len(uvaddger.data) > 0 and uvaddger.data[-1].operation.name in ['measure', 'barrier']:
+            del uvaddger.data[-1]
+        program = simulator.get_program(uvaddger)
+    if program is None and thetas is not None:
+        # Non-linear parameter expressions, G is then given per rotation gate of the bound circuit
+        uvaddger = uvaddger.assign_parameters(thetas)
+        program = simulator.get_program(uvaddger)
+        thetas = None
+    if program is None:
+        raise ValueError('qng does not support mid-circuit measurements, resets, non-unitary instructions '
+                         'or unbound non-linear parameter expressions')
+    thetas = np.zeros(program.num_parameters) if thetas is None else np.asarray(thetas, dtype=np.float64)
+    if thetas.shape[0] != program.num_parameters:
+        raise ValueError(
+            f'The number of parameters ({thetas.shape[0]}) must be equal to the number of parameters of the circuit ({program.num_parameters})')
+    thetas = thetas.reshape(1, -1)
+    rotation_opcodes = [simulator.OPCODES[name] for name in simulator.PARAMETERIZED]
+    is_param = np.isin(program.opcodes, rotation_opcodes)
+    if program.num_parameters > 0:
+        is_param &= program.indexes >= 0
+    angles = program.angles(thetas)
+    n = program.num_qubits
+    psi = np.zeros((1, 2**n), dtype=np.complex128)
+    psi[0, 0] = 1
     gs = []
-    # Splitting circuit into list of V and W sub-layer (non-parameter and parameter)
-    layers = utilities.split_into_layers(uvaddger)
-    qc = qiskit.QuantumCircuit(n, n)
-    for is_param_layer, layer in layers:
+    param_gates = []
+    for is_param_layer, layer in _qng_layers(program, is_param):
         if is_param_layer:
-            observers = utilities.create_observers(
-                utilities.add_layer_into_circuit(qc.copy(), layer), len(layer))
-            gs.append(calculate_g(qc, observers))
-        # Add next sub-layer into the current circuit
-        qc = utilities.add_layer_into_circuit(qc, layer)
-
-    G = gs[0]
-    for i in range(1, len(gs)):
-        G = scipy.linalg.block_diag(G, gs[i])
-    return G
+            # Rows are G_k|psi> = dU_k U_k^dagger |psi>, G_k = i K_k with the Hermitian K_k of calculate_g
+            K_psis = np.concatenate([simulator.apply_generator(
+                psi, n, program.opcodes[g], program.targets[g], program.controls[g]) for g in layer])
+            expectations = K_psis @ np.conjugate(psi[0])
+            g = np.conjugate(K_psis) @ K_psis.T - np.outer(np.conjugate(expectations), expectations)
+            g[(g.real < 10**(-10)) | ((g.real == 10**(-10)) & (g.imag < 0))] = 0
+            gs.append(g)
+            param_gates.extend(layer)
+        for g in layer:
+            simulator.apply_gate(psi, n, program.opcodes[g], program.targets[g], program.controls[g],
+                                 angles[:, g], program.matrices.get(g))
+    if len(gs) == 0:
+        return np.zeros((program.num_parameters, program.num_parameters))
+    G = scipy.linalg.block_diag(*gs)
+    if program.num_parameters == 0:
+        return G
+    # Chain rule from gate angles to parameters, angle_k = coefficient_k * theta[index_k] + offset_k
+    A = np.zeros((len(param_gates), program.num_parameters))
+    A[np.arange(len(param_gates)), program.indexes[param_gates]] = program.coefficients[param_gates]
+    return A.T @ G @ A
@@ -0,0 +1,266 @@
+import qiskit
+import typing
+import numpy as np
+from . import simulator
+
+
+def _rotation_matrices(name: str, thetas: np.ndarray) -> np.ndarray | None:
+    """Matrices of 1-parameter gates for a batch of angles
+
+    Args:
+        - name (str): gate name
+        - thetas (np.ndarray): N angles
+
+    Returns:
+        - np.ndarray | None: N x d x d matrices, None if the gate is not supported
+    """
+    cos = np.cos(thetas / 2)
+    sin = np.sin(thetas / 2)
+    zeros = np.zeros_like(cos)
+    ones = np.ones_like(cos)
+    if name == 'rx':
+        matrix = [[cos, -1j * sin], [-1j * sin, cos]]
+    elif name == 'ry':
+        matrix = [[cos, -sin], [sin, cos]]
+    elif name == 'rz':
+        matrix = [[np.exp(-0.5j * thetas), zeros], [zeros, np.exp(0.5j * thetas)]]
+    elif name in ['p', 'u1']:
+        matrix = [[ones, zeros], [zeros, np.exp(1j * thetas)]]
+    elif name in ['crx', 'cry', 'crz', 'cp', 'cu1']:
+        # Qiskit ordering: qargs[0] is the control and the least significant bit
+        target = _rotation_matrices(name[1:].replace('u1', 'p'), thetas)
+        matrices = np.zeros((len(thetas), 4, 4), dtype=np.complex128)
+        matrices[:, 0, 0] = matrices[:, 2, 2] = 1
+        matrices[:, 1, 1] = target[:, 0, 0]
+        matrices[:, 1, 3] = target[:, 0, 1]
+        matrices[:, 3, 1] = target[:, 1, 0]
+        matrices[:, 3, 3] = target[:, 1, 1]
+        return matrices
+    elif name == 'rzz':
+        phase = np.exp(-0.5j * thetas)
+        matrices = np.zeros((len(thetas), 4, 4), dtype=np.complex128)
+        matrices[:, 0, 0] = matrices[:, 3, 3] = phase
+        matrices[:, 1, 1] = matrices[:, 2, 2] = np.conjugate(phase)
+        return matrices
+    else:
+        return None
+    return np.moveaxis(np.asarray(matrix, dtype=np.complex128), -1, 0)
+
+
+def _parameter_values(param, X: np.ndarray, indexes: typing.Dict) -> np.ndarray:
+    """Value of a gate parameter for every sample
+
+    Args:
+        - param: float or ParameterExpression
+        - X (np.ndarray): N x P data
+        - indexes (typing.Dict): circuit parameter -> column of X
+
+    Returns:
+        - np.ndarray: N values
+    """
+    if not isinstance(param, qiskit.circuit.ParameterExpression):
+        return np.full(X.shape[0], float(param))
+    if isinstance(param, qiskit.circuit.Parameter):
+        return X[:, indexes[param]]
+    return np.array([
+        float(param.bind({p: x[indexes[p]] for p in param.parameters}))
+        for x in X
+    ])
+
+
+def _apply(states: np.ndarray, matrix: np.ndarray, axes: typing.List[int]) -> np.ndarray:
+    """Apply a k-qubit gate on a batch of states
+
+    Args:
+        - states (np.ndarray): N x 2 x ... x 2 tensor
+        - matrix (np.ndarray): d x d matrix or N x d x d matrices
+        - axes (typing.List[int]): tensor axes, from the most significant operand
+
+    Returns:
+        - np.ndarray: new states
+    """
+    k = len(axes)
+    moved = np.moveaxis(states, axes, range(1, k + 1))
+    shape = moved.shape
+    moved = moved.reshape(shape[0], 2**k, -1)
+    moved = np.matmul(matrix, moved)
+    return np.moveaxis(moved.reshape(shape), range(1, k + 1), axes)
+
+
+def statevectors(qc: qiskit.QuantumCircuit, X: np.ndarray, batch_size: int = 256,
+                 dtype: np.dtype = np.complex128) -> np.ndarray:
+    """Bind the feature map to all samples and simulate them together.
+    The feature j of a sample is bound to qc.parameters[j], same as QuantumKernel.
+
+    Args:
+        - qc (qiskit.QuantumCircuit): Feature map, ex: created by generator.by_num_rotations_and_cnot
+        - X (np.ndarray): N x P data
+        - batch_size (int, optional): Number of states simulated at the same time. Defaults to 256.
+        - dtype (np.dtype, optional): Type of returned states, np.complex64 halves the memory. Defaults to np.complex128.
+
+    Returns:
+        - np.ndarray: N x 2^n state vectors
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    parameters = list(qc.parameters)
+    if X.shape[1] != len(parameters):
+        raise ValueError(
+            f'The number of features ({X.shape[1]}) must be equal to the number of parameters of the feature map ({len(parameters)})')
+    indexes = {parameter: index for index, parameter in enumerate(parameters)}
+    num_qubits = qc.num_qubits
+    psis = np.empty((X.shape[0], 2**num_qubits), dtype=dtype)
+    program = simulator.get_program(qc)
+    if program is not None:
+        # Fast path: gates of the compiled program are applied in place
+        for start in range(0, X.shape[0], batch_size):
+            psis[start:start + batch_size] = program.run(X[start:start + batch_size])
+        return psis
+    for start in range(0, X.shape[0], batch_size):
+        X_batch = X[start:start + batch_size]
+        states = np.zeros((X_batch.shape[0], 2**num_qubits), dtype=np.complex128)
+        states[:, 0] = 1
+        states = states.reshape((X_batch.shape[0],) + (2,) * num_qubits)
+        for instruction in qc.data:
+            operation = instruction.operation
+            if operation.name == 'barrier':
+                continue
+            # Qubit q lives on axis 1 + (n - 1 - q), operands are listed from the most significant one
+            axes = [1 + num_qubits - 1 - qc.find_bit(qubit).index for qubit in reversed(instruction.qubits)]
+            if len(operation.params) == 0 or not any(
+                    isinstance(param, qiskit.circuit.ParameterExpression) for param in operation.params):
+                matrix = operation.to_matrix()
+            else:
+                values = [_parameter_values(param, X_batch, indexes) for param in operation.params]
+                matrix = None
+                if len(values) == 1:
+                    matrix = _rotation_matrices(operation.name, values[0])
+                if matrix is None:
+                    matrix = np.array([
+                        type(operation)(*value).to_matrix() for value in zip(*values)
+                    ])
+            states = _apply(states, matrix, axes)
+        psis[start:start + batch_size] = states.reshape(X_batch.shape[0], -1)
+    return psis
+
+
+def kernel_matrix(qc: qiskit.QuantumCircuit, X1: np.ndarray, X2: np.ndarray = None) -> np.ndarray:
+    """Fidelity kernel K[i, j] = |<psi(x1_i)|psi(x2_j)>|^2, computed with one matrix product
+
+    Args:
+        - qc (qiskit.QuantumCircuit): Feature map
+        - X1 (np.ndarray): N1 x P data
+        - X2 (np.ndarray, optional): N2 x P data, if None, return the Gram matrix of X1. Defaults to None.
+
+    Returns:
+        - np.ndarray: N1 x N2 matrix
+    """
+    psi1 = statevectors(qc, X1)
+    psi2 = psi1 if X2 is None else statevectors(qc, X2)
+    return np.abs(np.conjugate(psi1) @ psi2.T)**2
+
+
+class StatevectorKernel():
+    """Fidelity kernel of one feature map which keeps the encoded training states,
+    so evaluating the test samples only encodes them and does one matrix product.
+    """
+
+    def __init__(self, qc: qiskit.QuantumCircuit, dtype: np.dtype = np.complex128) -> None:
+        """
+        Args:
+            - qc (qiskit.QuantumCircuit): Feature map
+            - dtype (np.dtype, optional): Type of the stored states, np.complex64 halves the memory at 16-20 qubits. Defaults to np.complex128.
+        """
+        self.qc = qc
+        self.dtype = dtype
+        self.psi_train = None
+        return
+
+    def fit(self, X_train: np.ndarray) -> np.ndarray:
+        """Encode and store training states
+
+        Args:
+            - X_train (np.ndarray): N x P data
+
+        Returns:
+            - np.ndarray: N x N Gram matrix
+        """
+        self.psi_train = statevectors(self.qc, X_train, dtype=self.dtype)
+        return np.abs(np.conjugate(self.psi_train) @ self.psi_train.T)**2
+
+    def evaluate(self, X: np.ndarray) -> np.ndarray:
+        """Kernel between new samples and the stored training states
+
+        Args:
+            - X (np.ndarray): M x P data
+
+        Returns:
+            - np.ndarray: M x N matrix
+        """
+        if self.psi_train is None:
+            raise ValueError("Please call fit before evaluate")
+        psi = statevectors(self.qc, X, dtype=self.dtype)
+        return np.abs(np.conjugate(psi) @ self.psi_train.T)**2
+
+
+class NystromKernel():
+    """Low-rank approximation of the fidelity kernel: only m landmark samples are compared
+    with the data, K ~ K_nm K_mm^-1 K_mn. Samples are mapped to m features
+    phi(x) = K_xm U S^-1/2 (K_mm = U S U^T), so a linear SVM on phi approximates the kernel SVM
+    with O(N m) time and memory instead of O(N^2).
+    """
+
+    def __init__(self, qc: qiskit.QuantumCircuit, num_landmarks: int = 100, random_state: int = 0,
+                 dtype: np.dtype = np.complex128) -> None:
+        """
+        Args:
+            - qc (qiskit.QuantumCircuit): Feature map
+            - num_landmarks (int, optional): Number of landmark samples m. Defaults to 100.
+            - random_state (int, optional): Seed of the landmark selection. Defaults to 0.
+            - dtype (np.dtype, optional): Type of the stored landmark states. Defaults to np.complex128.
+        """
+        self.qc = qc
+        self.num_landmarks = num_landmarks
+        self.random_state = random_state
+        self.dtype = dtype
+        self.psi_landmarks = None
+        self.normalization = None
+        return
+
+    def fit(self, X_train: np.ndarray) -> np.ndarray:
+        """Pick landmarks among the training samples and map the training samples
+
+        Args:
+            - X_train (np.ndarray): N x P data
+
+        Returns:
+            - np.ndarray: N x k features, k <= m
+        """
+        X_train = np.asarray(X_train)
+        num_landmarks = min(self.num_landmarks, X_train.shape[0])
+        indexes = np.random.default_rng(self.random_state).choice(
+            X_train.shape[0], num_landmarks, replace=False)
+        psi_train = statevectors(self.qc, X_train, dtype=self.dtype)
+        self.psi_landmarks = psi_train[indexes]
+        values, vectors = np.linalg.eigh(self._kernel(self.psi_landmarks))
+        # Drop the null space of K_mm, it makes the inverse unstable
+        keep = values > 1e-10 * np.max(values)
+        self.normalization = vectors[:, keep] / np.sqrt(values[keep])
+        return self._kernel(psi_train) @ self.normalization
+
+    def _kernel(self, psi: np.ndarray) -> np.ndarray:
+        return np.abs(np.conjugate(psi) @ self.psi_landmarks.T)**2
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Map new samples with the landmarks chosen by fit
+
+        Args:
+            - X (np.ndarray): M x P data
+
+        Returns:
+            - np.ndarray: M x k features
+        """
+        if self.psi_landmarks is None:
+            raise ValueError("Please call fit before transform")
+        return self._kernel(statevectors(self.qc, X, dtype=self.dtype)) @ self.normalization
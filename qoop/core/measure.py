@@ -5,6 +5,7 @@ from qiskit.primitives import Sampler
 # from qiskit.providers.aer import noise
 # from qiskit.ignis.mitigation.measurement import complete_meas_cal, CompleteMeasFitter
 from ..backend import constant
+from . import simulator
 
 
 # def generate_depolarizing_noise_model(prob: float) -> noise.NoiseModel:
@@ -86,7 +87,17 @@ def measure(qc: qiskit.QuantumCircuit, parameter_values: np.ndarray = [], mode =
         sampler = Sampler()
         result = sampler.run(qc, shots = 10000).result().quasi_dists[0].get(0, 0)
     else:
-        if constant.MEASURE_MODE == constant.MeasureMode.THEORY.value:
+        program = None
+        if constant.MEASURE_MODE != constant.MeasureMode.EXPERIMENT.value:
+            program = simulator.get_program(qc)
+        if program is not None:
+            # Fast path, same values as the qiskit simulations below
+            phi_theta = program.run(parameter_values)[0]
+            if constant.MEASURE_MODE == constant.MeasureMode.THEORY.value:
+                result = np.abs(phi_theta[0])**2
+            else:
+                result = np.real(np.dot(np.conjugate(constant.PSI), phi_theta))**2
+        elif constant.MEASURE_MODE == constant.MeasureMode.THEORY.value:
             operator = qi.DensityMatrix(qc.assign_parameters(parameter_values)).data
             result = np.real(operator[0][0])
         elif constant.MEASURE_MODE == constant.MeasureMode.EXPERIMENT.value:
@@ -144,6 +155,37 @@ def measure(qc: qiskit.QuantumCircuit, parameter_values: np.ndarray = [], mode =
 
 
 
+def measure_batch(qc: qiskit.QuantumCircuit, parameter_valuess: np.ndarray) -> np.ndarray:
+    """Batch version of measure, one value per row of parameter_valuess. In THEORY and SIMULATE
+    mode all rows are simulated by one program run, in EXPERIMENT mode they are sent as one Sampler job.
+    qc is not modified.
+
+    Args:
+        - qc (QuantumCircuit): Measured circuit
+        - parameter_valuess (np.ndarray): B x P parameters
+
+    Returns:
+        - np.ndarray: B frequencies of 00.. cbit
+    """
+    parameter_valuess = np.asarray(parameter_valuess, dtype=np.float64)
+    program = None
+    if constant.MEASURE_MODE != constant.MeasureMode.EXPERIMENT.value:
+        program = simulator.get_program(qc)
+    if program is not None:
+        phi_thetas = program.run(parameter_valuess)
+        if constant.MEASURE_MODE == constant.MeasureMode.THEORY.value:
+            return np.abs(phi_thetas[:, 0])**2
+        return np.real(phi_thetas @ np.conjugate(constant.PSI))**2
+    if constant.MEASURE_MODE == constant.MeasureMode.EXPERIMENT.value:
+        qc = qc.copy()
+        qc.measure_all()
+        sampler = Sampler()
+        quasi_dists = sampler.run([qc] * len(parameter_valuess), parameter_values=list(parameter_valuess),
+                                  shots=10000).result().quasi_dists
+        return np.array([quasi_dist.get(0, 0) for quasi_dist in quasi_dists])
+    return np.array([measure(qc.copy(), parameter_values) for parameter_values in parameter_valuess])
+
+
 def x_measurement(qc: qiskit.QuantumCircuit, qubits, cbits=[]):
     """As its function name
 
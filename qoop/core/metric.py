@@ -1,4 +1,4 @@
-from ..core import ansatz, measure
+from ..core import ansatz, measure, simulator
 from qiskit.primitives import Sampler
 import numpy as np
 import qiskit
@@ -159,6 +159,49 @@ def gibbs_trace_distance(rho) -> float | None:
     return np.trace(np.linalg.matrix_power(rho, 2))
 
 
+def _density_matrix(qc: qiskit.QuantumCircuit, thetas: np.ndarray, inverse: bool = False) -> qi.DensityMatrix:
+    """Density matrix of qc (or of its inverse) with parameters thetas, from the program
+    cached on qc (see simulator.get_program) when the circuit is supported
+
+    Args:
+        - qc (qiskit.QuantumCircuit)
+        - thetas (np.ndarray)
+        - inverse (bool, optional): Use the inverse circuit. Defaults to False.
+
+    Returns:
+        - qi.DensityMatrix
+    """
+    program = simulator.get_program(qc)
+    if program is None:
+        qc = qc.assign_parameters(thetas)
+        return qi.DensityMatrix(qc.inverse() if inverse else qc)
+    if inverse:
+        program = program.inverse()
+    return qi.DensityMatrix(program.run(thetas)[0])
+
+
+def calculate_densities(
+    u: qiskit.QuantumCircuit, vdagger: qiskit.QuantumCircuit, thetas: np.ndarray
+) -> typing.Tuple:
+    """Same rho and sigma as calculate_premetric, without binding new circuits
+
+    Args:
+        u (qiskit.QuantumCircuit)
+        vdagger (qiskit.QuantumCircuit)
+        thetas (np.ndarray)
+
+    Returns:
+        tuple: including rho, sigma
+    """
+    if (len(u.parameters)) > 0:
+        rho = _density_matrix(u, thetas)
+        sigma = _density_matrix(vdagger, [], inverse=True)
+    else:
+        rho = _density_matrix(u, [])
+        sigma = _density_matrix(vdagger, thetas, inverse=True)
+    return rho, sigma
+
+
 def calculate_premetric(
     u: qiskit.QuantumCircuit, vdagger: qiskit.QuantumCircuit, thetas: np.ndarray
 ) -> typing.Tuple:
@@ -175,13 +218,9 @@ def calculate_premetric(
     """
     if (len(u.parameters)) > 0:
         qc = u.assign_parameters(thetas)
-        rho = qi.DensityMatrix(qc)
-        sigma = qi.DensityMatrix(vdagger.inverse())
-
     else:
         qc = vdagger.assign_parameters(thetas).inverse()
-        rho = qi.DensityMatrix(u)
-        sigma = qi.DensityMatrix(qc)
+    rho, sigma = calculate_densities(u, vdagger, thetas)
     return qc, rho, sigma
 
 
@@ -204,7 +243,7 @@ def gibbs_metrics(
     gibbs_traces = []
     gibbs_fidelities = []
     for thetas in thetass:
-        _, rho, sigma = calculate_premetric(u, vdagger, thetas)
+        rho, sigma = calculate_densities(u, vdagger, thetas)
         gibbs_rho = qi.partial_trace(rho, [0, 1])
         gibbs_sigma = qi.partial_trace(sigma, [0, 1])
         gibbs_trace = gibbs_trace_distance(gibbs_rho)
@@ -232,7 +271,7 @@ def gibbs_trace_distances(
     """
     gibbs_traces = []
     for thetas in thetass:
-        _, rho, sigma = calculate_premetric(u, vdagger, thetas)
+        rho, sigma = calculate_densities(u, vdagger, thetas)
         gibbs_rho = qi.partial_trace(rho, [0, 1])
         gibbs_sigma = qi.partial_trace(sigma, [0, 1])
         gibbs_trace = gibbs_trace_distance(gibbs_rho)
@@ -247,7 +286,7 @@ def gibbs_trace_fidelities(
 ) -> typing.List:
     gibbs_fidelities = []
     for thetas in thetass:
-        _, rho, sigma = calculate_premetric(u, vdagger, thetas)
+        rho, sigma = calculate_densities(u, vdagger, thetas)
         gibbs_rho = qi.partial_trace(rho, [0, 1])
         gibbs_sigma = qi.partial_trace(sigma, [0, 1])
         gibbs_fidelity = gibbs_trace_fidelity(gibbs_rho, gibbs_sigma)
@@ -294,7 +333,7 @@ def compilation_trace_fidelities(
     """
     compilation_fidelities = []
     for thetas in thetass:
-        _, rho, sigma = calculate_premetric(u, vdagger, thetas)
+        rho, sigma = calculate_densities(u, vdagger, thetas)
         compilation_fidelity = compilation_trace_fidelity(rho, sigma)
         compilation_fidelities.append(compilation_fidelity)
     return compilation_fidelities
@@ -318,7 +357,7 @@ def compilation_metrics(
     compilation_traces = []
     compilation_fidelities = []
     for thetas in thetass:
-        _, rho, sigma = calculate_premetric(u, vdagger, thetas)
+        rho, sigma = calculate_densities(u, vdagger, thetas)
         compilation_trace = compilation_trace_distance(rho, sigma)
         compilation_fidelity = compilation_trace_fidelity(rho, sigma)
         compilation_traces.append(compilation_trace)
@@ -343,7 +382,7 @@ def compilation_trace_distances(
     """
     compilation_traces = []
     for thetas in thetass:
-        _, rho, sigma = calculate_premetric(u, vdagger, thetas)
+        rho, sigma = calculate_densities(u, vdagger, thetas)
         compilation_trace = compilation_trace_distance(rho, sigma)
         compilation_traces.append(compilation_trace)
     return compilation_traces
@@ -1,6 +1,11 @@
+import abc
+import types
+import scipy
+import qiskit
+import qiskit.quantum_info as qi
 import numpy as np
 from ..backend import constant
-from ..core import gradient
+from ..core import gradient, simulator
 
 
 def sgd(thetas: np.ndarray, grad_loss: np.ndarray) -> np.ndarray:
@@ -36,14 +41,14 @@ def adam(
     Returns:
         - np.ndarray: parameters after update
     """
-    num_thetas = thetas.shape[0]
     beta1, beta2, epsilon = constant.BETA1, constant.BETA2, constant.EPSILON
-    for i in range(0, num_thetas):
-        m[i] = beta1 * m[i] + (1 - beta1) * grad_loss[i]
-        v[i] = beta2 * v[i] + (1 - beta2) * grad_loss[i] ** 2
-        mhat = m[i] / (1 - beta1 ** (iteration + 1))
-        vhat = v[i] / (1 - beta2 ** (iteration + 1))
-        thetas[i] -= (constant.LEARNING_RATE * (0.98)**iteration) * mhat / (np.sqrt(vhat) + epsilon)
+    grad_loss = np.asarray(grad_loss)
+    # m and v are updated in place, they can be lists or arrays
+    m[:] = beta1 * np.asarray(m) + (1 - beta1) * grad_loss
+    v[:] = beta2 * np.asarray(v) + (1 - beta2) * grad_loss ** 2
+    mhat = np.asarray(m) / (1 - beta1 ** (iteration + 1))
+    vhat = np.asarray(v) / (1 - beta2 ** (iteration + 1))
+    thetas -= (constant.LEARNING_RATE * (0.98)**iteration) * mhat / (np.sqrt(vhat) + epsilon)
     return thetas
 
 
@@ -99,6 +104,46 @@ def qng_fubini_study_scheduler(
     return thetas
 
 
+def _inverse_qfim(F: np.ndarray) -> np.ndarray:
+    """Pseudo-inverse of F, identity if det(F) is nearly equal zero. Both come from one eigendecomposition.
+
+    Args:
+        - F (np.ndarray): symmetric N x N matrix
+
+    Returns:
+        - np.ndarray: N x N matrix
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(F)
+    if np.isclose(np.prod(eigenvalues), 0):
+        return np.identity(F.shape[0])
+    # Same cutoff as np.linalg.pinv
+    keep = np.abs(eigenvalues) > 1e-15 * np.max(np.abs(eigenvalues))
+    return (eigenvectors[:, keep] / eigenvalues[keep]) @ eigenvectors[:, keep].T
+
+
+def solve_metric(G: np.ndarray, grad_loss: np.ndarray, regularization: float = constant.QNG_REGULARIZATION) -> np.ndarray:
+    """Natural gradient (G + regularization I)^-1 grad_loss of a metric tensor (QFIM, Fubini-Study).
+    The regularized matrix is solved by a Cholesky factorization, or by an eigendecomposition
+    which drops the non-positive eigenvalues when it is not positive definite.
+
+    Args:
+        - G (np.ndarray): N x N metric tensor
+        - grad_loss (np.ndarray): gradient of loss function
+        - regularization (float, optional): Tikhonov regularization. Defaults to constant.QNG_REGULARIZATION.
+
+    Returns:
+        - np.ndarray: N natural gradient
+    """
+    G = np.real(G)
+    G = (G + G.T) / 2 + regularization * np.identity(G.shape[0])
+    try:
+        return scipy.linalg.cho_solve(scipy.linalg.cho_factor(G), grad_loss)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(G)
+        keep = eigenvalues > 1e-12 * max(np.max(np.abs(eigenvalues)), 1e-300)
+        return eigenvectors[:, keep] @ ((eigenvectors[:, keep].T @ grad_loss) / eigenvalues[keep])
+
+
 def qng_qfim(
     thetas: np.ndarray, psi: np.ndarray, grad_psi: np.ndarray, grad_loss: np.ndarray
 ) -> np.ndarray:
@@ -114,12 +159,7 @@ def qng_qfim(
     Returns:
         - np.ndarray: parameters after update
     """
-    F = gradient.qfim(psi, grad_psi)
-    # Because det(QFIM) can be nearly equal zero
-    if np.isclose(np.linalg.det(F), 0):
-        inverse_F = np.identity(F.shape[0])
-    else:
-        inverse_F = np.linalg.pinv(F)
+    inverse_F = _inverse_qfim(gradient.qfim(psi, grad_psi))
     thetas -= constant.LEARNING_RATE * (inverse_F @ grad_loss)
     return thetas
 
@@ -147,13 +187,213 @@ def qng_adam(
     Returns:
         - np.ndarray: parameters after update
     """
-    F = gradient.qfim(psi, grad_psi)
-    # Because det(QFIM) can be nearly equal zero
-    if np.isclose(np.linalg.det(F), 0):
-        inverse_F = np.identity(F.shape[0])
-    else:
-        inverse_F = np.linalg.pinv(F)
+    inverse_F = _inverse_qfim(gradient.qfim(psi, grad_psi))
 
     grad = inverse_F @ grad_loss
     thetas = adam(thetas, m, v, i, grad)
     return thetas
+
+
+def _statevector(qc: qiskit.QuantumCircuit, thetas: np.ndarray) -> np.ndarray:
+    program = simulator.get_program(qc)
+    if program is not None:
+        return program.run(thetas)[0]
+    return qi.Statevector.from_instruction(qc.assign_parameters(thetas)).data
+
+
+class Optimizer(abc.ABC):
+    """Stateful optimizer, new thetas = step(thetas, grad_loss, qc). QNG optimizers compute
+    their metric tensor from qc, the composed circuit of the loss. State such as the Adam
+    moments is kept between steps, reset() starts a new optimization.
+    """
+
+    def __init__(self, learning_rate: float = None) -> None:
+        """
+        Args:
+            - learning_rate (float, optional): Defaults to None, constant.LEARNING_RATE at each step.
+        """
+        self.learning_rate = learning_rate
+        self.iteration = 0
+        return
+
+    def get_learning_rate(self) -> float:
+        return constant.LEARNING_RATE if self.learning_rate is None else self.learning_rate
+
+    def reset(self) -> None:
+        self.iteration = 0
+        return
+
+    def step(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit = None) -> np.ndarray:
+        """Compute new parameters
+
+        Args:
+            - thetas (np.ndarray): parameters, not modified
+            - grad_loss (np.ndarray): gradient of loss function
+            - qc (qiskit.QuantumCircuit, optional): composed circuit, used by QNG optimizers. Defaults to None.
+
+        Returns:
+            - np.ndarray: parameters after update
+        """
+        thetas = self.update(np.array(thetas, dtype=np.float64), np.asarray(grad_loss, dtype=np.float64), qc)
+        self.iteration += 1
+        return thetas
+
+    @abc.abstractmethod
+    def update(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        """Update rule of the optimizer, called by step
+
+        Args:
+            - thetas (np.ndarray): copy of the parameters, may be modified
+            - grad_loss (np.ndarray): gradient of loss function
+            - qc (qiskit.QuantumCircuit): composed circuit
+
+        Returns:
+            - np.ndarray: parameters after update
+        """
+
+
+class FunctionOptimizer(Optimizer):
+    """Wrap an update function f(thetas, grad_loss) -> thetas
+    """
+
+    def __init__(self, optimizer_func: types.FunctionType) -> None:
+        super().__init__()
+        self.optimizer_func = optimizer_func
+        return
+
+    def update(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return self.optimizer_func(thetas, grad_loss)
+
+
+class SGD(Optimizer):
+    def update(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return thetas - self.get_learning_rate() * grad_loss
+
+
+class Adam(Optimizer):
+    """Adam with array moment buffers, same update as adam
+    """
+
+    def __init__(self, learning_rate: float = None) -> None:
+        super().__init__(learning_rate)
+        self.m = None
+        self.v = None
+        return
+
+    def reset(self) -> None:
+        super().reset()
+        self.m = None
+        self.v = None
+        return
+
+    def update(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        if self.m is None:
+            self.m = np.zeros_like(thetas)
+            self.v = np.zeros_like(thetas)
+        beta1, beta2, epsilon = constant.BETA1, constant.BETA2, constant.EPSILON
+        self.m *= beta1
+        self.m += (1 - beta1) * grad_loss
+        self.v *= beta2
+        self.v += (1 - beta2) * grad_loss ** 2
+        mhat = self.m / (1 - beta1 ** (self.iteration + 1))
+        vhat = self.v / (1 - beta2 ** (self.iteration + 1))
+        thetas -= (self.get_learning_rate() * (0.98)**self.iteration) * mhat / (np.sqrt(vhat) + epsilon)
+        return thetas
+
+
+class QNGQFIM(Optimizer):
+    """thetas^{i + 1} = thetas^{i} - alpha * (F + regularization I)^{-1} * nabla L, F is the QFIM
+    """
+
+    def __init__(self, learning_rate: float = None, regularization: float = constant.QNG_REGULARIZATION) -> None:
+        """
+        Args:
+            - learning_rate (float, optional): Defaults to None, constant.LEARNING_RATE.
+            - regularization (float, optional): see solve_metric. Defaults to constant.QNG_REGULARIZATION.
+        """
+        super().__init__(learning_rate)
+        self.regularization = regularization
+        return
+
+    def metric(self, thetas: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        psi = np.expand_dims(_statevector(qc, thetas), 1)
+        grad_psi = gradient.grad_psi(qc, thetas, r=1 / 2, s=np.pi)
+        return gradient.qfim(psi, grad_psi)
+
+    def natural_gradient(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return solve_metric(self.metric(thetas, qc), grad_loss, self.regularization)
+
+    def update(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return thetas - self.get_learning_rate() * self.natural_gradient(thetas, grad_loss, qc)
+
+
+class QNGAdam(Adam):
+    """Adam on the natural gradient of QNGQFIM
+    """
+
+    def __init__(self, learning_rate: float = None, regularization: float = constant.QNG_REGULARIZATION) -> None:
+        super().__init__(learning_rate)
+        self.qfim = QNGQFIM(regularization=regularization)
+        return
+
+    def update(self, thetas: np.ndarray, grad_loss: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return super().update(thetas, self.qfim.natural_gradient(thetas, grad_loss, qc), qc)
+
+
+class QNGFubiniStudy(QNGQFIM):
+    """QNG with the block-diagonal Fubini-Study tensor of gradient.qng
+    """
+
+    def metric(self, thetas: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return gradient.qng(qc, thetas)
+
+
+class QNGFubiniStudyHessian(QNGQFIM):
+    """QNG with the Fubini-Study tensor of gradient.qng_hessian
+    """
+
+    def metric(self, thetas: np.ndarray, qc: qiskit.QuantumCircuit) -> np.ndarray:
+        return gradient.qng_hessian(qc, thetas)
+
+
+class QNGFubiniStudyScheduler(QNGFubiniStudy):
+    """QNGFubiniStudy with a learning rate decayed by constant.GAMMA every 30 steps
+    """
+
+    def get_learning_rate(self) -> float:
+        return super().get_learning_rate() * constant.GAMMA ** round(self.iteration / 30)
+
+
+OPTIMIZERS = {
+    constant.OptimizerName.SGD.value: SGD,
+    constant.OptimizerName.ADAM.value: Adam,
+    constant.OptimizerName.QNG_ADAM.value: QNGAdam,
+    constant.OptimizerName.QNG_FUBINI_STUDY.value: QNGFubiniStudy,
+    constant.OptimizerName.QNG_FUBINI_STUDY_HESSIAN.value: QNGFubiniStudyHessian,
+    constant.OptimizerName.QNG_FUBINI_STUDY_SCHEDULER.value: QNGFubiniStudyScheduler,
+    constant.OptimizerName.QNG_QFIM.value: QNGQFIM
+}
+
+
+def get_optimizer(_optimizer: Optimizer | types.FunctionType | str) -> Optimizer:
+    """Optimizer object of a name in constant.OptimizerName, of one of the update functions
+    of this module (same name) or of a custom function f(thetas, grad_loss) -> thetas
+
+    Args:
+        - _optimizer (Optimizer | types.FunctionType | str)
+
+    Returns:
+        - Optimizer
+    """
+    if isinstance(_optimizer, Optimizer):
+        return _optimizer
+    if isinstance(_optimizer, str):
+        if _optimizer not in OPTIMIZERS:
+            raise ValueError(f'The optimizer must be one of {list(OPTIMIZERS.keys())}')
+        return OPTIMIZERS[_optimizer]()
+    if callable(_optimizer):
+        if _optimizer.__name__ in OPTIMIZERS and _optimizer is globals().get(_optimizer.__name__):
+            return OPTIMIZERS[_optimizer.__name__]()
+        return FunctionOptimizer(_optimizer)
+    raise ValueError(
+        'The optimizer must be a function f: thetas -> thetas or string in qsee.core.optimizer or self-define')
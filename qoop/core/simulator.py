@@ -0,0 +1,450 @@
+import qiskit
+import qiskit.quantum_info as qi
+import typing
+import operator
+import numpy as np
+
+# Single-qubit gates act on the target, controlled gates act on the target when the control is 1
+OPCODES = {
+    'h': 0, 'x': 1, 'y': 2, 'z': 3, 's': 4, 'sdg': 5, 't': 6, 'tdg': 7,
+    'rx': 8, 'ry': 9, 'rz': 10, 'p': 11,
+    'cx': 12, 'cy': 13, 'cz': 14, 'ch': 15,
+    'crx': 16, 'cry': 17, 'crz': 18, 'cp': 19,
+    'swap': 20,
+    # Any other gate without parameter, applied with its matrix
+    'matrix': 21
+}
+ALIASES = {'cnot': 'cx', 'u1': 'p', 'cu1': 'cp', 'id': None, 'barrier': None, 'delay': None}
+PARAMETERIZED = ['rx', 'ry', 'rz', 'p', 'crx', 'cry', 'crz', 'cp']
+CONTROLLED = ['cx', 'cy', 'cz', 'ch', 'crx', 'cry', 'crz', 'cp']
+SQRT1_2 = 1 / np.sqrt(2)
+
+
+class GateProgram():
+    """Circuit compiled to flat arrays: opcode, target qubit, control qubit (-1 if none), index of
+    the parameter (-1 if constant) and angle = coefficient * theta[index] + offset.
+    The global phase of the circuit is kept in the same (index, coefficient, offset) form.
+    A program is applied to a batch of state vectors with in-place updates of strided views,
+    without creating qiskit objects, so binding new parameters costs nothing.
+    """
+
+    def __init__(self, num_qubits: int, num_parameters: int, opcodes: np.ndarray, targets: np.ndarray,
+                 controls: np.ndarray, indexes: np.ndarray, coefficients: np.ndarray, offsets: np.ndarray,
+                 matrices: typing.Dict[int, typing.Tuple[np.ndarray, typing.List[int]]],
+                 phase: typing.Tuple[int, float, float] = (-1, 0.0, 0.0)) -> None:
+        self.num_qubits = num_qubits
+        self.num_parameters = num_parameters
+        self.opcodes = opcodes
+        self.targets = targets
+        self.controls = controls
+        self.indexes = indexes
+        self.coefficients = coefficients
+        self.offsets = offsets
+        # gate position -> (matrix, qubits) for opcode 'matrix'
+        self.matrices = matrices
+        # (index, coefficient, offset) of the global phase
+        self.phase = phase
+        self._inverse = None
+        return
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def angles(self, thetas: np.ndarray) -> np.ndarray:
+        """Angles of all gates for a batch of parameter vectors
+
+        Args:
+            - thetas (np.ndarray): B x P parameters
+
+        Returns:
+            - np.ndarray: B x G angles
+        """
+        values = np.zeros((thetas.shape[0], len(self.opcodes)))
+        has_parameter = self.indexes >= 0
+        values[:, has_parameter] = thetas[:, self.indexes[has_parameter]] * self.coefficients[has_parameter]
+        return values + self.offsets
+
+    def phases(self, thetas: np.ndarray) -> np.ndarray:
+        """Global phases for a batch of parameter vectors
+
+        Args:
+            - thetas (np.ndarray): B x P parameters
+
+        Returns:
+            - np.ndarray: B phases
+        """
+        index, coefficient, offset = self.phase
+        if index < 0:
+            return np.full(thetas.shape[0], offset)
+        return coefficient * thetas[:, index] + offset
+
+    def inverse(self) -> 'GateProgram':
+        """Program of the inverse circuit: reversed gates, negated angles, S <-> Sdg, T <-> Tdg
+        and conjugate transposed matrices. Same parameters as this program.
+
+        Returns:
+            - GateProgram
+        """
+        if self._inverse is None:
+            inverse_opcodes = {OPCODES['s']: OPCODES['sdg'], OPCODES['sdg']: OPCODES['s'],
+                               OPCODES['t']: OPCODES['tdg'], OPCODES['tdg']: OPCODES['t']}
+            num_gates = len(self.opcodes)
+            self._inverse = GateProgram(
+                num_qubits=self.num_qubits,
+                num_parameters=self.num_parameters,
+                opcodes=np.array([inverse_opcodes.get(opcode, opcode) for opcode in self.opcodes[::-1]], dtype=np.int64),
+                targets=self.targets[::-1].copy(),
+                controls=self.controls[::-1].copy(),
+                indexes=self.indexes[::-1].copy(),
+                coefficients=-self.coefficients[::-1],
+                offsets=-self.offsets[::-1],
+                matrices={num_gates - 1 - i: (np.conjugate(matrix).T, qubits)
+                          for i, (matrix, qubits) in self.matrices.items()},
+                phase=(self.phase[0], -self.phase[1], -self.phase[2]))
+            self._inverse._inverse = self
+        return self._inverse
+
+    def run(self, thetas: np.ndarray = None, states: np.ndarray = None, start: int = 0, stop: int = None) -> np.ndarray:
+        """Apply gates start..stop-1 to a batch of states, the global phase is applied
+        together with the first gate (start = 0)
+
+        Args:
+            - thetas (np.ndarray, optional): P or B x P parameters. Defaults to None (no parameter).
+            - states (np.ndarray, optional): B x 2^n states, updated in place. Defaults to None, |0...0>.
+            - start (int, optional): Defaults to 0.
+            - stop (int, optional): Defaults to None, the last gate.
+
+        Returns:
+            - np.ndarray: B x 2^n states
+        """
+        thetas = np.zeros((1, self.num_parameters)) if thetas is None else np.asarray(thetas, dtype=np.float64)
+        if thetas.ndim == 1:
+            thetas = thetas.reshape(1, -1)
+        if thetas.shape[1] != self.num_parameters:
+            raise ValueError(
+                f'The number of parameters ({thetas.shape[1]}) must be equal to the number of parameters of the circuit ({self.num_parameters})')
+        if states is None:
+            states = np.zeros((thetas.shape[0], 2**self.num_qubits), dtype=np.complex128)
+            states[:, 0] = 1
+        angles = self.angles(thetas)
+        if start == 0:
+            phases = self.phases(thetas)
+            if np.any(phases != 0):
+                states *= np.exp(1j * phases).reshape(-1, 1)
+        stop = len(self.opcodes) if stop is None else stop
+        for i in range(start, stop):
+            apply_gate(states, self.num_qubits, self.opcodes[i], self.targets[i], self.controls[i],
+                       angles[:, i], self.matrices.get(i))
+        return states
+
+    def overlap_gradient(self, thetas: np.ndarray, target: np.ndarray) -> typing.Tuple[complex, np.ndarray]:
+        """Amplitude a = <target|psi(thetas)> and its derivatives by adjoint differentiation:
+        one forward run, then one backward sweep which undoes the gates on psi and on
+        lambda = U_G^dagger...U_{g+1}^dagger |target>, and adds <lambda| dU_g |psi> to the
+        derivative of the parameter of gate g. The cost is O(gates) for all parameters.
+
+        Args:
+            - thetas (np.ndarray): P parameters
+            - target (np.ndarray): 2^n state
+
+        Returns:
+            - typing.Tuple[complex, np.ndarray]: a, P derivatives of a
+        """
+        thetas = np.asarray(thetas, dtype=np.float64).reshape(1, -1)
+        psi = self.run(thetas)
+        amplitude = np.vdot(target, psi[0])
+        lam = np.asarray(target, dtype=np.complex128).reshape(1, -1).copy()
+        inverse = self.inverse()
+        inverse_angles = inverse.angles(thetas)
+        gradient = np.zeros(self.num_parameters, dtype=np.complex128)
+        num_gates = len(self.opcodes)
+        for g in range(num_gates - 1, -1, -1):
+            if self.indexes[g] >= 0:
+                # dU_g / dangle = generator U_g, psi is still the state after gate g
+                mu = apply_generator(psi, self.num_qubits, self.opcodes[g], self.targets[g], self.controls[g])
+                gradient[self.indexes[g]] += self.coefficients[g] * np.vdot(lam[0], mu[0])
+            j = num_gates - 1 - g
+            for states in (psi, lam):
+                apply_gate(states, self.num_qubits, inverse.opcodes[j], inverse.targets[j],
+                           inverse.controls[j], inverse_angles[:, j], inverse.matrices.get(j))
+        if self.phase[0] >= 0:
+            # d exp(i phase) / dtheta
+            gradient[self.phase[0]] += 1j * self.phase[1] * amplitude
+        return amplitude, gradient
+
+
+def _linear(param, indexes: typing.Dict) -> typing.Tuple[int, float, float] | None:
+    """Write a gate parameter as coefficient * theta[index] + offset
+
+    Returns:
+        - typing.Tuple[int, float, float] | None: (index, coefficient, offset), None if not linear in one parameter
+    """
+    if not isinstance(param, qiskit.circuit.ParameterExpression):
+        return -1, 0.0, float(param)
+    if isinstance(param, qiskit.circuit.Parameter):
+        return (indexes[param], 1.0, 0.0) if param in indexes else None
+    if len(param.parameters) != 1:
+        return None
+    parameter = list(param.parameters)[0]
+    if parameter not in indexes:
+        return None
+    values = [float(param.bind({parameter: x})) for x in [0, 1, 2]]
+    if not np.isclose(values[2] - values[1], values[1] - values[0]):
+        return None
+    return indexes[parameter], values[1] - values[0], values[0]
+
+
+def compile_circuit(qc: qiskit.QuantumCircuit) -> GateProgram | None:
+    """Compile a circuit to a GateProgram, parameters are numbered as in qc.parameters
+    (same order as qc.assign_parameters)
+
+    Args:
+        - qc (qiskit.QuantumCircuit)
+
+    Returns:
+        - GateProgram | None: None if the circuit has a parameterized gate or global phase which is not supported
+    """
+    parameters = list(qc.parameters)
+    indexes = {parameter: index for index, parameter in enumerate(parameters)}
+    phase = _linear(qc.global_phase, indexes)
+    if phase is None:
+        return None
+    opcodes, targets, controls, gate_indexes, coefficients, offsets = [], [], [], [], [], []
+    matrices = {}
+    for instruction in qc.data:
+        operation = instruction.operation
+        name = ALIASES.get(operation.name, operation.name)
+        if name is None:
+            continue
+        qubits = [qc.find_bit(qubit).index for qubit in instruction.qubits]
+        if name == 'measure' or name == 'reset':
+            return None
+        if name in PARAMETERIZED:
+            linear = _linear(operation.params[0], indexes)
+            if linear is None:
+                return None
+        elif len(operation.params) > 0 and any(
+                isinstance(param, qiskit.circuit.ParameterExpression) for param in operation.params):
+            return None
+        else:
+            linear = (-1, 0.0, 0.0)
+        if name not in OPCODES:
+            try:
+                # Operator also covers gates without to_matrix, ex: generic controlled gates
+                matrix = qi.Operator(operation).data
+            except Exception:
+                return None
+            matrices[len(opcodes)] = (matrix, qubits)
+            name = 'matrix'
+        opcodes.append(OPCODES[name])
+        if name in CONTROLLED:
+            controls.append(qubits[0])
+            targets.append(qubits[1])
+        elif name == 'swap':
+            controls.append(qubits[1])
+            targets.append(qubits[0])
+        else:
+            controls.append(-1)
+            targets.append(qubits[0])
+        gate_indexes.append(linear[0])
+        coefficients.append(linear[1])
+        offsets.append(linear[2])
+    return GateProgram(
+        num_qubits=qc.num_qubits,
+        num_parameters=len(parameters),
+        opcodes=np.array(opcodes, dtype=np.int64),
+        targets=np.array(targets, dtype=np.int64),
+        controls=np.array(controls, dtype=np.int64),
+        indexes=np.array(gate_indexes, dtype=np.int64),
+        coefficients=np.array(coefficients, dtype=np.float64),
+        offsets=np.array(offsets, dtype=np.float64),
+        matrices=matrices,
+        phase=phase)
+
+
+def _halves(states: np.ndarray, num_qubits: int, target: int, control: int = -1) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Views of the amplitudes where the target qubit is 0 and 1 (and the control qubit is 1)
+
+    Args:
+        - states (np.ndarray): B x 2^n states
+        - num_qubits (int)
+        - target (int)
+        - control (int, optional): Defaults to -1, no control.
+
+    Returns:
+        - typing.Tuple[np.ndarray, np.ndarray]: two views sharing memory with states
+    """
+    batch = states.shape[0]
+    if control < 0:
+        view = states.reshape(batch, 2**(num_qubits - 1 - target), 2, 2**target)
+        return view[:, :, 0], view[:, :, 1]
+    high, low = max(target, control), min(target, control)
+    view = states.reshape(batch, 2**(num_qubits - 1 - high), 2, 2**(high - low - 1), 2, 2**low)
+    if control == high:
+        view = view[:, :, 1]
+        return view[:, :, :, 0], view[:, :, :, 1]
+    view = view[:, :, :, :, 1]
+    return view[:, :, 0], view[:, :, 1]
+
+
+def _rotate(zero: np.ndarray, one: np.ndarray, m00, m01, m10, m11) -> None:
+    """[zero, one] <- [[m00, m01], [m10, m11]] [zero, one], in place"""
+    copy = zero.copy()
+    zero *= m00
+    zero += m01 * one
+    one *= m11
+    one += m10 * copy
+    return
+
+
+def apply_gate(states: np.ndarray, num_qubits: int, opcode: int, target: int, control: int,
+               angles: np.ndarray, matrix: typing.Tuple[np.ndarray, typing.List[int]] = None) -> None:
+    """Apply one gate of a GateProgram to a batch of states, in place
+
+    Args:
+        - states (np.ndarray): B x 2^n states
+        - num_qubits (int)
+        - opcode (int): see OPCODES
+        - target (int)
+        - control (int): -1 if none
+        - angles (np.ndarray): B angles, not used by constant gates
+        - matrix (typing.Tuple[np.ndarray, typing.List[int]], optional): (matrix, qubits) for opcode 'matrix'. Defaults to None.
+    """
+    if opcode == OPCODES['matrix']:
+        matrix, qubits = matrix
+        k = len(qubits)
+        tensor = states.reshape((states.shape[0],) + (2,) * num_qubits)
+        # Qubit q lives on axis 1 + (n - 1 - q), operands are listed from the most significant one
+        axes = [1 + num_qubits - 1 - qubit for qubit in reversed(qubits)]
+        moved = np.moveaxis(tensor, axes, range(1, k + 1))
+        shape = moved.shape
+        moved = np.matmul(matrix, moved.reshape(shape[0], 2**k, -1)).reshape(shape)
+        states[...] = np.moveaxis(moved, range(1, k + 1), axes).reshape(states.shape)
+        return
+    if opcode == OPCODES['swap']:
+        # Swap the amplitudes |..1..0..> and |..0..1..>
+        high, low = max(target, control), min(target, control)
+        view = states.reshape(states.shape[0], 2**(num_qubits - 1 - high), 2, 2**(high - low - 1), 2, 2**low)
+        copy = view[:, :, 0, :, 1].copy()
+        view[:, :, 0, :, 1] = view[:, :, 1, :, 0]
+        view[:, :, 1, :, 0] = copy
+        return
+    zero, one = _halves(states, num_qubits, target, control)
+    if opcode in (OPCODES['x'], OPCODES['cx']):
+        copy = zero.copy()
+        zero[...] = one
+        one[...] = copy
+    elif opcode in (OPCODES['y'], OPCODES['cy']):
+        copy = zero.copy()
+        zero[...] = -1j * one
+        one[...] = 1j * copy
+    elif opcode in (OPCODES['z'], OPCODES['cz']):
+        one *= -1
+    elif opcode in (OPCODES['h'], OPCODES['ch']):
+        copy = zero.copy()
+        zero += one
+        zero *= SQRT1_2
+        copy -= one
+        one[...] = copy * SQRT1_2
+    elif opcode == OPCODES['s']:
+        one *= 1j
+    elif opcode == OPCODES['sdg']:
+        one *= -1j
+    elif opcode == OPCODES['t']:
+        one *= np.exp(0.25j * np.pi)
+    elif opcode == OPCODES['tdg']:
+        one *= np.exp(-0.25j * np.pi)
+    else:
+        # Rotations, one angle per state
+        angles = angles.reshape((-1,) + (1,) * (zero.ndim - 1))
+        if opcode in (OPCODES['rx'], OPCODES['crx']):
+            cos, sin = np.cos(angles / 2), np.sin(angles / 2)
+            _rotate(zero, one, cos, -1j * sin, -1j * sin, cos)
+        elif opcode in (OPCODES['ry'], OPCODES['cry']):
+            cos, sin = np.cos(angles / 2), np.sin(angles / 2)
+            _rotate(zero, one, cos, -sin, sin, cos)
+        elif opcode in (OPCODES['rz'], OPCODES['crz']):
+            zero *= np.exp(-0.5j * angles)
+            one *= np.exp(0.5j * angles)
+        elif opcode in (OPCODES['p'], OPCODES['cp']):
+            one *= np.exp(1j * angles)
+    return
+
+
+def apply_generator(states: np.ndarray, num_qubits: int, opcode: int, target: int, control: int) -> np.ndarray:
+    """Apply the generator G of a rotation gate, dU(angle) / dangle = G U(angle):
+    -iX/2, -iY/2, -iZ/2 for RX, RY, RZ, i|1><1| for P, restricted to control = 1 for controlled gates
+
+    Args:
+        - states (np.ndarray): B x 2^n states, not modified
+        - num_qubits (int)
+        - opcode (int): rotation opcode, see PARAMETERIZED
+        - target (int)
+        - control (int): -1 if none
+
+    Returns:
+        - np.ndarray: B x 2^n states
+    """
+    result = np.zeros_like(states)
+    zero, one = _halves(states, num_qubits, target, control)
+    result_zero, result_one = _halves(result, num_qubits, target, control)
+    if opcode in (OPCODES['rx'], OPCODES['crx']):
+        result_zero[...] = -0.5j * one
+        result_one[...] = -0.5j * zero
+    elif opcode in (OPCODES['ry'], OPCODES['cry']):
+        result_zero[...] = -0.5 * one
+        result_one[...] = 0.5 * zero
+    elif opcode in (OPCODES['rz'], OPCODES['crz']):
+        result_zero[...] = -0.5j * zero
+        result_one[...] = 0.5j * one
+    elif opcode in (OPCODES['p'], OPCODES['cp']):
+        result_one[...] = 1j * one
+    return result
+
+
+def _signature(qc: qiskit.QuantumCircuit) -> typing.List:
+    """Global phase, gate names, qubits and parameters of a circuit as one flat list. These objects are
+    shared by the copies of the circuit, so signatures are compared by identity.
+    """
+    signature = [qc.global_phase]
+    for instruction in qc.data:
+        signature.append(instruction.operation.name)
+        signature.append(instruction.qubits)
+        signature.extend(instruction.operation.params)
+    return signature
+
+
+def get_program(qc: qiskit.QuantumCircuit) -> GateProgram | None:
+    """Compiled program of a circuit, cached on the circuit (attribute _qoop_program) and
+    kept by qc.copy(). It is compiled again when a gate is replaced or added (ex: by mutate)
+    or when parameters are bound in place.
+
+    Args:
+        - qc (qiskit.QuantumCircuit)
+
+    Returns:
+        - GateProgram | None: None if the circuit is not supported
+    """
+    signature = _signature(qc)
+    cache = getattr(qc, '_qoop_program', None)
+    if cache is not None and len(cache[0]) == len(signature) and all(map(operator.is_, cache[0], signature)):
+        return cache[1]
+    program = compile_circuit(qc)
+    qc._qoop_program = (signature, program)
+    return program
+
+
+def statevectors(qc: qiskit.QuantumCircuit, thetas: np.ndarray = None) -> np.ndarray | None:
+    """State vectors of a circuit for a batch of parameter vectors
+
+    Args:
+        - qc (qiskit.QuantumCircuit)
+        - thetas (np.ndarray, optional): P or B x P parameters, same order as qc.assign_parameters. Defaults to None.
+
+    Returns:
+        - np.ndarray | None: B x 2^n states, None if the circuit is not supported
+    """
+    program = get_program(qc)
+    if program is None:
+        return None
+    return program.run(thetas)
@@ -0,0 +1,196 @@
+import os
+import json
+import typing
+import types
+import qiskit
+import collections
+import collections.abc
+from ..backend import utilities
+
+
+class CircuitArchive():
+    """All circuits of a run packed in one append-only file (circuits.qpy, a sequence of
+    qpy blobs) with an offset index (circuits.index.jsonl). A circuit is read back with
+    one seek, without opening the other ones. Names follow the old per-file layout:
+    circuit_{generation}_{index}, best_circuit_{generation} and best_circuit.
+    Writing a name again appends a new blob, the last one wins.
+    """
+
+    def __init__(self, folder: str) -> None:
+        """
+        Args:
+            - folder (str): Run folder
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, 'circuits.qpy')
+        self.index_path = os.path.join(folder, 'circuits.index.jsonl')
+        # name -> (offset, length)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            self.read_index()
+        return
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, 'circuits.index.jsonl'))
+
+    def read_index(self) -> None:
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.index = {}
+        with open(self.index_path) as file:
+            for line in file:
+                if line.strip() == '':
+                    continue
+                entry = json.loads(line)
+                # Skip blobs which were not completely written before a crash
+                if entry['offset'] + entry['length'] <= size:
+                    self.index[entry['name']] = (entry['offset'], entry['length'])
+        return
+
+    def clear(self) -> None:
+        """Remove all circuits
+        """
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        open(self.path, 'wb').close()
+        open(self.index_path, 'w').close()
+        self.index = {}
+        return
+
+    def put(self, name: str, qc: qiskit.QuantumCircuit) -> None:
+        """Append a circuit
+
+        Args:
+            - name (str): ex: circuit_1_0
+            - qc (qiskit.QuantumCircuit)
+        """
+        self.put_many([(name, qc)])
+        return
+
+    def put_many(self, items: typing.List[typing.Tuple[str, qiskit.QuantumCircuit]]) -> None:
+        """Append circuits with one open of each file
+
+        Args:
+            - items (typing.List[typing.Tuple[str, qiskit.QuantumCircuit]]): (name, circuit) pairs
+        """
+        if len(items) == 0:
+            return
+        entries = []
+        with open(self.path, 'ab') as file:
+            offset = file.tell()
+            for name, qc in items:
+                data = utilities.circuit_to_bytes(qc)
+                file.write(data)
+                entries.append({'name': name, 'offset': offset, 'length': len(data)})
+                offset += len(data)
+        # The index is written after the blobs, so an indexed blob is always complete
+        with open(self.index_path, 'a') as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + '\n')
+                self.index[entry['name']] = (entry['offset'], entry['length'])
+        return
+
+    def get(self, name: str) -> qiskit.QuantumCircuit:
+        """Read one circuit
+
+        Args:
+            - name (str): ex: circuit_1_0
+
+        Returns:
+            - qiskit.QuantumCircuit
+        """
+        offset, length = self.index[name]
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            return utilities.circuit_from_bytes(file.read(length))
+
+    def get_circuit(self, generation: int, index: int) -> qiskit.QuantumCircuit:
+        """Read circuit index of a generation, generation starts from 1 as in the file names
+
+        Args:
+            - generation (int)
+            - index (int)
+
+        Returns:
+            - qiskit.QuantumCircuit
+        """
+        return self.get(f'circuit_{generation}_{index}')
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class CircuitLoader():
+    """Read circuits by name and keep the recently used ones in a small LRU cache
+    """
+
+    def __init__(self, read_func: types.FunctionType, max_size: int = 64) -> None:
+        """
+        Args:
+            - read_func (types.FunctionType): f(name) -> qiskit.QuantumCircuit, ex: CircuitArchive.get
+            - max_size (int, optional): Number of kept circuits. Defaults to 64.
+        """
+        self.read_func = read_func
+        self.max_size = max_size
+        self.circuits = collections.OrderedDict()
+        return
+
+    def get(self, name: str) -> qiskit.QuantumCircuit:
+        if name in self.circuits:
+            self.circuits.move_to_end(name)
+            return self.circuits[name]
+        qc = self.read_func(name)
+        if self.max_size > 0:
+            self.circuits[name] = qc
+            while len(self.circuits) > self.max_size:
+                self.circuits.popitem(last=False)
+        return qc
+
+
+class LazyCircuits(collections.abc.MutableSequence):
+    """List of circuits where saved circuits are only names, deserialized on access.
+    Circuits added later (append, insert, item assignment) are kept in memory as in a list.
+    """
+
+    class Saved():
+        def __init__(self, name: str) -> None:
+            self.name = name
+            return
+
+    def __init__(self, loader: CircuitLoader, names: typing.List[str]) -> None:
+        """
+        Args:
+            - loader (CircuitLoader)
+            - names (typing.List[str]): names of saved circuits, ex: ['circuit_1_0', 'circuit_1_1']
+        """
+        self.loader = loader
+        self.items = [LazyCircuits.Saved(name) for name in names]
+        return
+
+    def _load(self, item):
+        if isinstance(item, LazyCircuits.Saved):
+            return self.loader.get(item.name)
+        return item
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._load(item) for item in self.items[index]]
+        return self._load(self.items[index])
+
+    def __setitem__(self, index, value) -> None:
+        self.items[index] = value
+        return
+
+    def __delitem__(self, index) -> None:
+        del self.items[index]
+        return
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def insert(self, index: int, value) -> None:
+        self.items.insert(index, value)
+        return
@@ -0,0 +1,244 @@
+import os
+import time
+import queue
+import pickle
+import typing
+import types
+import itertools
+import threading
+import traceback
+import multiprocessing
+import concurrent.futures
+from multiprocessing.managers import BaseManager, DictProxy
+import qiskit
+from ..backend import utilities
+
+# Shared objects, they live in the broker process
+_tasks = queue.Queue()
+_results = queue.Queue()
+_config = {}
+
+
+def _get_tasks() -> queue.Queue:
+    return _tasks
+
+
+def _get_results() -> queue.Queue:
+    return _results
+
+
+def _get_config() -> dict:
+    return _config
+
+
+class BrokerManager(BaseManager):
+    """Broker holding the task queue, the result queue and the config (fitness function, dataset).
+    Tasks are (task id, qpy bytes, other arguments of the fitness function), results are (task id, fitness, error).
+    """
+    pass
+
+
+BrokerManager.register('get_tasks', callable=_get_tasks)
+BrokerManager.register('get_results', callable=_get_results)
+BrokerManager.register('get_config', callable=_get_config, proxytype=DictProxy)
+
+
+def run_worker(address: typing.Tuple[str, int], authkey: bytes, fitness_func: types.FunctionType = None,
+               dataset: typing.Dict = None, poll_interval: float = 1.0) -> None:
+    """Score circuits from a broker until it is shut down. On another host, with the key
+    of the broker (DistributedEvaluator.authkey.hex()):
+    python -c "from qoop.evolution.distributed import run_worker; run_worker(('broker-host', 50000), bytes.fromhex('...'))"
+
+    Args:
+        - address (typing.Tuple[str, int]): Broker address
+        - authkey (bytes): Broker authentication key
+        - fitness_func (types.FunctionType, optional): If None, read from the broker, it must then be importable on this host. Defaults to None.
+        - dataset (typing.Dict, optional): If None, read from the broker together with fitness_func. Defaults to None.
+        - poll_interval (float, optional): Seconds between two checks of the task queue. Defaults to 1.0.
+    """
+    manager = BrokerManager(address=address, authkey=authkey)
+    manager.connect()
+    tasks = manager.get_tasks()
+    results = manager.get_results()
+    if fitness_func is None:
+        payload = manager.get_config().get('payload')
+        if payload is None:
+            raise ValueError("The fitness function can not be sent by the broker, please pass it to run_worker")
+        fitness_func, dataset = pickle.loads(payload)
+    dataset = {} if dataset is None else dataset
+    while True:
+        try:
+            task_id, data, kwargs = tasks.get(timeout=poll_interval)
+        except queue.Empty:
+            continue
+        except (EOFError, ConnectionError):
+            # Broker is shut down
+            return
+        try:
+            qc = utilities.circuit_from_bytes(data)
+            if getattr(fitness_func, 'is_batch', False):
+                fitness = fitness_func([qc], **dataset, **kwargs)[0]
+            else:
+                fitness = fitness_func(qc, **dataset, **kwargs)
+            result = (task_id, float(fitness), None)
+        except Exception:
+            result = (task_id, None, traceback.format_exc())
+        try:
+            results.put(result)
+        except (EOFError, ConnectionError):
+            return
+
+
+class DistributedEvaluator():
+    """Evaluator which sends circuits to workers through a broker, workers may run on other
+    hosts (see run_worker). Same interface as evaluator.ProcessEvaluator, so it is used by
+    EEnvironment.set_evaluator with mode='parallel' or 'steady_state'.
+    A task which has no result after lease_timeout (ex: its worker died) is sent again,
+    late or duplicated results of a task are ignored.
+    The broker exchanges pickled objects: anyone who can reach its port and knows authkey can run
+    code on this host, so the port must not be exposed to untrusted networks.
+    """
+
+    def __init__(self, fitness_func: types.FunctionType, address: typing.Tuple[str, int] = ('localhost', 0),
+                 authkey: bytes = None, dataset: typing.Dict = None, num_local_workers: int = 0,
+                 lease_timeout: float = 300, max_retries: int = 3) -> None:
+        """
+        Args:
+            - fitness_func (types.FunctionType): f(qc, **dataset) -> float, or a batch function marked by fitness.batch
+            - address (typing.Tuple[str, int], optional): Broker address, use ('', port) to accept remote workers. Defaults to ('localhost', 0), a free local port.
+            - authkey (bytes, optional): Broker authentication key, give it to remote workers (see run_worker). Defaults to None, a random key in self.authkey.
+            - dataset (typing.Dict, optional): Keyword arguments passed to fitness_func. Defaults to None.
+            - num_local_workers (int, optional): Number of workers started on this host. Defaults to 0.
+            - lease_timeout (float, optional): Seconds before a task is sent again. Defaults to 300.
+            - max_retries (int, optional): Number of times a task is sent again before failing. Defaults to 3.
+        """
+        self.fitness_func = fitness_func
+        self.address = address
+        self.authkey = os.urandom(32) if authkey is None else authkey
+        self.dataset = {} if dataset is None else dataset
+        self.num_local_workers = num_local_workers
+        self.lease_timeout = lease_timeout
+        self.max_retries = max_retries
+        self.manager = None
+        self.workers = []
+        # task id -> [qpy bytes, deadline, number of sends, future, kwargs]
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.task_ids = itertools.count()
+        self.stopped = threading.Event()
+        self.collector = None
+        return
+
+    def start(self) -> BrokerManager:
+        if self.manager is None:
+            self.manager = BrokerManager(address=self.address, authkey=self.authkey)
+            self.manager.start()
+            # Real address when the port is chosen by the system
+            self.address = self.manager.address
+            self.tasks = self.manager.get_tasks()
+            self.results = self.manager.get_results()
+            try:
+                self.manager.get_config()['payload'] = pickle.dumps((self.fitness_func, self.dataset))
+            except (pickle.PicklingError, AttributeError, TypeError):
+                # Ex: closures, only local workers which receive the function directly can be used
+                pass
+            context = multiprocessing.get_context('fork')
+            for _ in range(self.num_local_workers):
+                worker = context.Process(
+                    target=run_worker,
+                    args=(self.address, self.authkey, self.fitness_func, self.dataset),
+                    daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            self.stopped.clear()
+            self.collector = threading.Thread(target=self._collect, daemon=True)
+            self.collector.start()
+        return self.manager
+
+    def _collect(self) -> None:
+        """Match results with futures and send expired tasks again
+        """
+        while not self.stopped.is_set():
+            try:
+                task_id, fitness, error = self.results.get(timeout=0.2)
+                with self.lock:
+                    task = self.pending.pop(task_id, None)
+                # None: duplicated result of a task which was sent twice
+                if task is not None:
+                    if error is None:
+                        task[3].set_result(fitness)
+                    else:
+                        task[3].set_exception(RuntimeError(error))
+            except queue.Empty:
+                pass
+            except (EOFError, ConnectionError):
+                return
+            now = time.monotonic()
+            with self.lock:
+                expired = [(task_id, task) for task_id, task in self.pending.items() if task[1] < now]
+                for task_id, task in expired:
+                    if task[2] > self.max_retries:
+                        self.pending.pop(task_id)
+                        task[3].set_exception(TimeoutError(
+                            f'Task {task_id} has no result after {task[2]} tries'))
+                        continue
+                    task[1] = now + self.lease_timeout
+                    task[2] += 1
+                    self.tasks.put((task_id, task[0], task[4]))
+        return
+
+    def submit(self, circuit: qiskit.QuantumCircuit, **kwargs) -> concurrent.futures.Future:
+        """Compute fitness value of one circuit asynchronously
+
+        Args:
+            - circuit (qiskit.QuantumCircuit)
+            - kwargs: other arguments of fitness_func
+
+        Returns:
+            - concurrent.futures.Future
+        """
+        self.start()
+        future = concurrent.futures.Future()
+        data = utilities.circuit_to_bytes(circuit)
+        task_id = next(self.task_ids)
+        with self.lock:
+            self.pending[task_id] = [data, time.monotonic() + self.lease_timeout, 1, future, kwargs]
+        self.tasks.put((task_id, data, kwargs))
+        return future
+
+    def map(self, circuits: typing.List[qiskit.QuantumCircuit], **kwargs) -> typing.List[float]:
+        """Compute fitness values of circuits, keeping the order
+
+        Args:
+            - circuits (typing.List[qiskit.QuantumCircuit])
+            - kwargs: other arguments of fitness_func, ex: fraction=0.25
+
+        Returns:
+            - typing.List[float]
+        """
+        futures = [self.submit(circuit, **kwargs) for circuit in circuits]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        if self.manager is not None:
+            self.stopped.set()
+            self.collector.join()
+            for worker in self.workers:
+                worker.terminate()
+                worker.join()
+            self.workers = []
+            self.manager.shutdown()
+            self.manager = None
+            with self.lock:
+                for task in self.pending.values():
+                    task[3].cancel()
+                self.pending = {}
+        return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return
@@ -3,15 +3,22 @@
 from .ecircuit import ECircuit
 from .selection import sastify_circuit
 from ..evolution import crossover, mutate, selection, threshold, generator
+from .evaluator import ProcessEvaluator, to_arrays
+from .archive import CircuitArchive, CircuitLoader, LazyCircuits
 from ..core import random_circuit
 from ..backend import utilities
 from .environment_parent import Metadata
+from .environment_synthesis import MetadataSynthesis
+from .environment_compilation import MetadataCompilation
+from .utilities import get_random_state, set_random_state
 import types
 import typing
 import os
 import json
 import datetime
 import pathlib
+import collections
+import random
 import qiskit
 import numpy as np
 import matplotlib.pyplot as plt
@@ -50,6 +57,69 @@ def multiple_compile(func, params):
             k.append((number))
     return k
 
+# Saved in funcs.json, used by load to rebuild the metadata
+METADATA_CLASSES = {
+    metadata_class.__name__: metadata_class
+    for metadata_class in [Metadata, MetadataSynthesis, MetadataCompilation]
+}
+
+
+class FitnessCache():
+    """Bounded LRU cache of fitness values, keyed by utilities.circuit_key
+    """
+
+    def __init__(self, max_size: int = 128) -> None:
+        """
+        Args:
+            - max_size (int, optional): Maximum number of stored fitness values, 0 disables the cache. Defaults to 128.
+        """
+        self.max_size = max_size
+        self.values = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def get(self, key: str):
+        """Return the cached fitness value or None
+
+        Args:
+            - key (str): circuit key
+
+        Returns:
+            - float | None
+        """
+        if key in self.values:
+            self.values.move_to_end(key)
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, fitness: float) -> None:
+        """Store a fitness value, evicting the least recently used one when full
+
+        Args:
+            - key (str): circuit key
+            - fitness (float)
+        """
+        if self.max_size <= 0:
+            return
+        self.values[key] = fitness
+        self.values.move_to_end(key)
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+        return
+
+    def clear(self) -> None:
+        self.values.clear()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
 class EEnvironment():
     """Saved information for evolution process
     """
@@ -61,17 +131,33 @@ class EEnvironment():
                  mutate_func: types.FunctionType = mutate.bitflip_mutate,
                  selection_func: types.FunctionType = selection.elitist_selection,
                  threshold_func: types.FunctionType = threshold.compilation_threshold,
+                 cache_size: int = 128,
+                 fitness_store=None,
+                 dataset: typing.Dict = None,
+                 max_workers: int = None,
+                 chunksize: int = 1,
+                 fractions: typing.List[float] = None,
+                 halving_rate: int = 2,
+                 prefilter_func: types.FunctionType = None,
                  ) -> None:
         """_summary_
 
         Args:
             params (typing.Union[typing.List, str]): Other params for GA proces
-            fitness_func (types.FunctionType, optional): Defaults to None.
+            fitness_func (types.FunctionType, optional): f(qc) -> float, or f(qcs) -> List[float] marked by fitness.batch. Defaults to None.
             crossover_func (types.FunctionType, optional): Defaults to None.
             mutate_func (types.FunctionType, optional): Defaults to None.
             selection_func (types.FunctionType, optional): Defaults to None.
             pool (_type_, optional): Pool gate. Defaults to None.
             file_name (str, optional): Path of saved file.
+            cache_size (int, optional): Number of fitness values kept in the LRU cache, 0 disables it. Defaults to 128.
+            fitness_store (store.SQLiteFitnessStore, optional): Persistent store consulted before calling fitness_func. Defaults to None.
+            dataset (typing.Dict, optional): Keyword arguments of fitness_func, ex: {'X_train': ..., 'y_train': ...}. Array-likes (ex: pandas objects) are converted to numpy arrays, in parallel mode they are placed once into shared memory. Defaults to None.
+            max_workers (int, optional): Number of worker processes in parallel mode. Defaults to number of CPUs.
+            chunksize (int, optional): Number of circuits sent to a worker at once. Defaults to 1.
+            fractions (typing.List[float], optional): Successive halving, ex: [0.25, 0.5]: new circuits are scored with fitness_func(qc, fraction=0.25, ...), the best 1 / halving_rate of them with fraction=0.5, and only the remaining ones on the full data. Defaults to None.
+            halving_rate (int, optional): Defaults to 2.
+            prefilter_func (types.FunctionType, optional): Cheap proxy fitness, ex: fitness.alignment_batch, new circuits are pruned by it before fractions and fitness_func. Defaults to None.
         """
 
         self.metadata = metadata
@@ -110,6 +196,27 @@ class EEnvironment():
         self.best_circuits: typing.List[ECircuit] = []
         self.best_fitness = 0
         self.file_name = None
+        self.fitness_cache = FitnessCache(cache_size)
+        # Serial mode receives the same numpy arrays as the workers of parallel mode
+        self.dataset = to_arrays({} if dataset is None else dataset)
+        self.set_fitness_store(fitness_store)
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.evaluator = None
+        self.fractions = [] if fractions is None else fractions
+        self.halving_rate = halving_rate
+        self.prefilter_func = prefilter_func
+        # What is already written in the saved folder, see save
+        self.num_saved = {}
+        self.archive = None
+        # Fitness values which are not in the checkpoint yet
+        self.unsaved_fitnesss = {}
+        # True when the last evol stopped because threshold_func is reached
+        self.is_finished = False
+        # Random state of a loaded run, restored when evol resumes it
+        self.random_state = None
+        # Indexes of the circuits pruned by the last evaluate, see set_prefilter
+        self.pruned_indexes = []
         return
 
     def set_filename(self, file_name: str):
@@ -118,6 +225,66 @@ class EEnvironment():
     
     def set_fitness_func(self, fitness_func):
         self.fitness_func = fitness_func
+        # Cached values are keyed by circuit only, they were computed by the old fitness function
+        self.fitness_cache.clear()
+        # Workers hold the old fitness function
+        self.close()
+        return
+
+    def set_dataset(self, dataset: typing.Dict):
+        """
+        Args:
+            - dataset (typing.Dict): Keyword arguments of fitness_func, array-likes are converted to numpy arrays
+        """
+        self.dataset = to_arrays(dataset)
+        # The fingerprint of a fitness store must match the new dataset
+        self.set_fitness_store(self.fitness_store)
+        # Workers hold the old dataset
+        self.close()
+        return
+
+    def set_evaluator(self, evaluator):
+        """Use another evaluator in parallel and steady-state modes,
+        ex: distributed.DistributedEvaluator to score circuits on other hosts
+
+        Args:
+            - evaluator: object with the map / submit / shutdown methods of evaluator.ProcessEvaluator
+        """
+        self.close()
+        self.evaluator = evaluator
+        return
+
+    def set_successive_halving(self, fractions: typing.List[float], halving_rate: int = 2):
+        """Score new circuits on growing subsamples and keep the best 1 / halving_rate at each step
+
+        Args:
+            - fractions (typing.List[float]): ex: [0.25, 0.5], fitness_func must accept a fraction argument (ex: fitness.qsvm)
+            - halving_rate (int, optional): Defaults to 2.
+        """
+        self.fractions = fractions
+        self.halving_rate = halving_rate
+        return
+
+    def set_prefilter(self, prefilter_func: types.FunctionType, halving_rate: int = None):
+        """Two-stage evaluation: new circuits are scored by a cheap proxy (ex: fitness.alignment_batch),
+        only the best 1 / halving_rate of them are scored by fitness_func. The proxy is computed in the
+        main process, a batch function scores them in one call. Pruned circuits are ranked below the
+        scored ones for selection, and recorded as NaN in metadata.fitnessss.
+
+        Args:
+            - prefilter_func (types.FunctionType): f(qc, **dataset) -> float or batch function, None disables it
+            - halving_rate (int, optional): Defaults to the current halving_rate.
+        """
+        self.prefilter_func = prefilter_func
+        if halving_rate is not None:
+            self.halving_rate = halving_rate
+        return
+
+    def set_fitness_store(self, fitness_store):
+        # Values of the store are keyed by the fingerprint of the dataset
+        if hasattr(fitness_store, 'attach'):
+            fitness_store.attach(self.dataset)
+        self.fitness_store = fitness_store
         return
 
     def set_circuitss(self, circuitss):
@@ -132,13 +299,43 @@ class EEnvironment():
         self.circuits: typing.List[qiskit.QuantumCircuit] = circuits
         return
 
+    def replace_population(self, circuits: typing.List[qiskit.QuantumCircuit], auto_save: bool = True):
+        """Replace the population of the last completed generation, ex: by migrants,
+        so the recorded and saved population is the one which is evolved
+
+        Args:
+            - circuits (typing.List[qiskit.QuantumCircuit]): new population
+            - auto_save (bool, optional): Rewrite the generation in the saved folder. Defaults to True.
+        """
+        self.circuits = circuits
+        if len(self.circuitss) > 0:
+            self.circuitss[-1] = circuits
+            if self.num_saved.get('circuitss', 0) == len(self.circuitss):
+                self.num_saved['circuitss'] -= 1
+        if auto_save:
+            self.save()
+        return
+
     def evol(self, verbose: int = 0, mode = 'parallel', auto_save: bool = True):
+        # A loaded generation which was not completed (see load) is computed again
+        del self.metadata.fitnessss[self.metadata.current_generation:]
+        del self.metadata.best_fitnesss[self.metadata.current_generation:]
+        del self.best_circuits[self.metadata.current_generation:]
+        self.is_finished = False
+        if self.random_state is not None:
+            set_random_state(self.random_state)
+            self.random_state = None
+        if mode == 'steady_state':
+            return self.evol_steady_state(verbose, auto_save)
         if verbose == 1:
             bar = utilities.ProgressBar(
                 max_value=self.metadata.num_generation, disable=False)
         if self.metadata.current_generation == 0:
-            print("Initialize list of circuit ...")
-            self.init()
+            if len(self.circuits) == 0:
+                print("Initialize list of circuit ...")
+                self.init()
+                if auto_save:
+                    self.save()
             print("Start evol progress ...")
         elif self.metadata.current_generation == self.metadata.num_generation:
             return
@@ -161,22 +358,19 @@ class EEnvironment():
             ######## Cost #######
             #####################
             # new_population = multiple_compile(new_population)
-            self.fitnesss = []
-            if mode == 'parallel':
-                fitnesss_temp = multiple_compile(self.fitness_func, self.circuits)
-                self.fitnesss.extend(fitnesss_temp)
-            else:
-                for i in range(len(self.circuits)):
-                    print(self.circuits[i])
-                    self.fitnesss.append(self.fitness_func(self.circuits[i]))
-                    
+            self.fitnesss = self.evaluate(self.circuits, mode)
             self.metadata.best_fitnesss.append(np.max(self.fitnesss))
 
             self.best_circuits.append(self.circuits[np.argmax(self.fitnesss)])
             if self.best_circuit is None:
                 self.best_circuit = self.best_circuits[0]
             print(np.round(self.fitnesss, 4))
-            self.metadata.fitnessss.append(self.fitnesss)
+            if len(self.pruned_indexes) > 0:
+                # Proxy scores are on another scale, they are not part of the fitness history
+                self.metadata.fitnessss.append([np.nan if i in self.pruned_indexes else fitness
+                                                for i, fitness in enumerate(self.fitnesss)])
+            else:
+                self.metadata.fitnessss.append(self.fitnesss)
             if auto_save:
                 self.save()
             #####################
@@ -190,11 +384,13 @@ class EEnvironment():
                     if self.threshold_func(full_best_fitness):
                         print(
                             f'End progress soon at generation {self.metadata.current_generation}, best score ever: {full_best_fitness}')
+                        self.is_finished = True
                         return self
                 else:
                     if self.threshold_func(self.best_fitness):
                         print(
                             f'End progress soon at generation {self.metadata.current_generation}, best score ever: {self.best_fitness}')
+                        self.is_finished = True
                         return self
 
             #####################
@@ -215,7 +411,8 @@ class EEnvironment():
             ##### Mutation #####
             ####################
             for i in range(0, len(new_circuits)):
-                new_circuits[i] = self.mutate_func(new_circuits[i])
+                # Parents are also kept in best_circuits, mutate_func may edit its input in place
+                new_circuits[i] = self.mutate_func(new_circuits[i].copy())
                 # normalize parameter of circuit
                 new_circuits[i] = utilities.compose_circuit([new_circuits[i]])
             #####################
@@ -230,6 +427,278 @@ class EEnvironment():
         print(f'End evol progress, best score ever: {self.best_fitness}')
         return self
 
+    def evol_steady_state(self, verbose: int = 0, auto_save: bool = True):
+        """Asynchronous steady-state evolution. As soon as any evaluation completes, the circuit
+        joins the population (the worst circuit is dropped) and a new offspring is sent to the free
+        worker, so slow circuits do not stall the other cores. The budget is num_generation * num_circuit
+        evaluations, one generation is counted every num_circuit evaluations. An offspring which is
+        structurally identical to a member or to a circuit under evaluation is dropped without using the
+        budget, unless 10 * num_circuit offsprings in a row are clones (converged population).
+        Circuits of the current population with a known fitness (resumed run) do not use the budget.
+        """
+        if self.metadata.current_generation == self.metadata.num_generation:
+            return self
+        if verbose == 1:
+            bar = utilities.ProgressBar(
+                max_value=self.metadata.num_generation, disable=False)
+        if self.metadata.current_generation == 0:
+            if len(self.circuits) == 0:
+                print("Initialize list of circuit ...")
+                self.init()
+                if auto_save:
+                    self.save()
+            print("Start steady-state evol progress ...")
+        else:
+            print(
+                f"Continute steady-state evol progress at generation {self.metadata.current_generation} ...")
+        num_workers = self.max_workers if self.max_workers is not None else os.cpu_count()
+        budget = (self.metadata.num_generation - self.metadata.current_generation) * self.metadata.num_circuit
+        evaluator = self.get_evaluator()
+        # Circuits with a known fitness, ex: a resumed population, are kept without using the budget,
+        # unscored circuits become the first offsprings
+        offsprings = []
+        circuits, self.circuits, self.fitnesss = self.circuits, [], []
+        # Circuit keys of the population, in the order of self.circuits
+        keys = []
+        for circuit in circuits:
+            key = utilities.circuit_key(circuit)
+            fitness = self.lookup_fitness(key)
+            if fitness is None:
+                offsprings.append(circuit)
+            else:
+                self.circuits.append(circuit)
+                self.fitnesss.append(fitness)
+                keys.append(key)
+        running = {}
+        num_submitted = 0
+        num_evaluations = 0
+        num_clones = 0
+        while num_evaluations < budget:
+            scored = []
+            # Keep all workers busy
+            while len(running) < num_workers and num_submitted < budget:
+                if len(offsprings) == 0:
+                    if len(self.circuits) < 2:
+                        break
+                    offsprings.extend(self.breed())
+                circuit = offsprings.pop(0)
+                key = utilities.circuit_key(circuit)
+                # Cache hits would otherwise fill the population with copies of its members
+                if num_clones < 10 * self.metadata.num_circuit and (
+                        key in keys or key in [running_key for _, running_key in running.values()]
+                        or key in [scored_key for _, _, scored_key in scored]):
+                    num_clones += 1
+                    continue
+                num_clones = 0
+                num_submitted += 1
+                fitness = self.lookup_fitness(key)
+                if fitness is None:
+                    running[evaluator.submit(circuit)] = (circuit, key)
+                else:
+                    scored.append((circuit, fitness, key))
+            if len(scored) == 0:
+                if len(running) == 0:
+                    break
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    circuit, key = running.pop(future)
+                    fitness = future.result()
+                    self.remember_fitness(key, fitness)
+                    scored.append((circuit, fitness, key))
+            for circuit, fitness, key in scored:
+                num_evaluations += 1
+                self.circuits.append(circuit)
+                self.fitnesss.append(fitness)
+                keys.append(key)
+                if len(self.circuits) > self.metadata.num_circuit:
+                    worst = int(np.argmin(self.fitnesss))
+                    self.circuits.pop(worst)
+                    self.fitnesss.pop(worst)
+                    keys.pop(worst)
+                if num_evaluations % self.metadata.num_circuit == 0:
+                    if verbose == 1:
+                        bar.update(1)
+                    if self.end_steady_state_generation(auto_save):
+                        for future in running:
+                            future.cancel()
+                        return self
+        print(f'End evol progress, best score ever: {self.best_fitness}')
+        return self
+
+    def breed(self) -> typing.List[qiskit.QuantumCircuit]:
+        """Create two offsprings from two parents picked among the selected circuits of the population
+
+        Returns:
+            - typing.List[qiskit.QuantumCircuit]
+        """
+        parents = self.selection_func(self.circuits, self.fitnesss)
+        if len(parents) < 2:
+            parents = self.circuits
+        circuit1, circuit2 = random.sample(parents, 2)
+        offsprings = list(self.crossover_func(circuit1, circuit2))
+        for i in range(0, len(offsprings)):
+            offsprings[i] = self.mutate_func(offsprings[i].copy())
+            # normalize parameter of circuit
+            offsprings[i] = utilities.compose_circuit([offsprings[i]])
+        return offsprings
+
+    def end_steady_state_generation(self, auto_save: bool = True) -> bool:
+        """Record the current population as one generation
+
+        Returns:
+            - bool: True if the threshold is reached
+        """
+        self.metadata.current_generation += 1
+        print(f"Running at generation {self.metadata.current_generation}")
+        print(np.round(self.fitnesss, 4))
+        self.metadata.fitnessss.append(list(self.fitnesss))
+        self.metadata.best_fitnesss.append(np.max(self.fitnesss))
+        self.best_circuits.append(self.circuits[np.argmax(self.fitnesss)])
+        self.circuitss.append(list(self.circuits))
+        is_finished = False
+        if self.best_fitness < np.max(self.fitnesss):
+            self.best_circuit = self.circuits[np.argmax(self.fitnesss)]
+            self.best_fitness = np.max(self.fitnesss)
+            if hasattr(self, 'fitness_full_func'):
+                best_fitness = self.fitness_full_func(self.best_circuit)
+            else:
+                best_fitness = self.best_fitness
+            if self.threshold_func(best_fitness):
+                print(
+                    f'End progress soon at generation {self.metadata.current_generation}, best score ever: {best_fitness}')
+                is_finished = True
+        self.is_finished = is_finished
+        if auto_save:
+            self.save()
+        return is_finished
+
+    def evaluate(self, circuits: typing.List[qiskit.QuantumCircuit], mode: str = 'parallel') -> typing.List[float]:
+        """Compute fitness of circuits, circuits which are structurally identical
+        to an already scored one are taken from the fitness cache or the fitness store.
+        With a prefilter or successive halving (see set_prefilter, set_successive_halving), pruned circuits
+        get their proxy or partial score, capped just below the lowest full-data fitness, and are not cached.
+        Their indexes are kept in pruned_indexes, evol records them as NaN in metadata.fitnessss.
+
+        Args:
+            - circuits (typing.List[qiskit.QuantumCircuit])
+            - mode (str, optional): 'parallel' or not. Defaults to 'parallel'.
+
+        Returns:
+            - typing.List[float]: fitness values
+        """
+        fitnesss = [None] * len(circuits)
+        # Unscored key -> indexes of circuits sharing this key
+        pending = {}
+        for i, circuit in enumerate(circuits):
+            key = utilities.circuit_key(circuit)
+            if key in pending:
+                pending[key].append(i)
+                continue
+            fitness = self.lookup_fitness(key)
+            if fitness is None:
+                pending[key] = [i]
+            else:
+                fitnesss[i] = fitness
+        keys = list(pending.keys())
+        pending_circuits = [circuits[indexes[0]] for indexes in pending.values()]
+        values = {}
+        # Prefilter and successive halving: pruned candidates are ranked below every survivor
+        stages = [(self.prefilter_func, {})] if self.prefilter_func is not None else []
+        stages.extend([(None, {'fraction': fraction}) for fraction in self.fractions])
+        pruned = {}
+        for fitness_func, kwargs in stages:
+            if len(keys) <= 1:
+                break
+            scores = self.compute(pending_circuits, mode, fitness_func, **kwargs)
+            order = np.argsort(scores)[::-1]
+            num_survivors = int(np.ceil(len(keys) / self.halving_rate))
+            for i in order[num_survivors:]:
+                pruned[keys[i]] = scores[i]
+            keys = [keys[i] for i in order[:num_survivors]]
+            pending_circuits = [pending_circuits[i] for i in order[:num_survivors]]
+        for key, fitness in zip(keys, self.compute(pending_circuits, mode)):
+            # Only full-data fitness values are kept
+            self.remember_fitness(key, fitness)
+            values[key] = fitness
+        if len(pruned) > 0:
+            floor = np.nextafter(np.min(list(values.values()) + [
+                fitness for fitness in fitnesss if fitness is not None]), -np.inf)
+            for key, score in pruned.items():
+                values[key] = min(score, floor)
+        for key, indexes in pending.items():
+            for i in indexes:
+                fitnesss[i] = values[key]
+        self.pruned_indexes = [i for key in pruned for i in pending[key]]
+        return fitnesss
+
+    def compute(self, circuits: typing.List[qiskit.QuantumCircuit], mode: str = 'parallel',
+                fitness_func: types.FunctionType = None, **kwargs) -> typing.List[float]:
+        """Call a fitness function on circuits, without cache
+
+        Args:
+            - circuits (typing.List[qiskit.QuantumCircuit])
+            - mode (str, optional): 'parallel' or not. Defaults to 'parallel'.
+            - fitness_func (types.FunctionType, optional): Another function computed in the main process, ex: prefilter_func. Defaults to None, fitness_func of the environment.
+            - kwargs: other arguments of the fitness function, ex: fraction=0.25
+
+        Returns:
+            - typing.List[float]: fitness values
+        """
+        if len(circuits) == 0:
+            return []
+        if fitness_func is None:
+            fitness_func = self.fitness_func
+            if mode == 'parallel':
+                return self.get_evaluator().map(circuits, **kwargs)
+        if getattr(fitness_func, 'is_batch', False):
+            return fitness_func(circuits, **self.dataset, **kwargs)
+        values = []
+        for circuit in circuits:
+            print(circuit)
+            values.append(fitness_func(circuit, **self.dataset, **kwargs))
+        return values
+
+    def lookup_fitness(self, key: str):
+        """Find a computed fitness value in the fitness cache, then in the fitness store
+
+        Args:
+            - key (str): circuit key
+
+        Returns:
+            - float | None
+        """
+        fitness = self.fitness_cache.get(key)
+        if fitness is None and self.fitness_store is not None:
+            fitness = self.fitness_store.get(key, self.fitness_func.__name__)
+            if fitness is not None:
+                self.fitness_cache.put(key, fitness)
+        return fitness
+
+    def remember_fitness(self, key: str, fitness: float) -> None:
+        self.fitness_cache.put(key, fitness)
+        self.unsaved_fitnesss[key] = fitness
+        if self.fitness_store is not None:
+            self.fitness_store.put(key, self.fitness_func.__name__, fitness)
+        return
+
+    def get_evaluator(self) -> ProcessEvaluator:
+        """Return the worker pool, workers are started once and kept warm between generations
+        """
+        if self.evaluator is None:
+            self.evaluator = ProcessEvaluator(
+                self.fitness_func, max_workers=self.max_workers,
+                chunksize=self.chunksize, dataset=self.dataset)
+        return self.evaluator
+
+    def close(self) -> None:
+        """Stop the worker processes
+        """
+        if self.evaluator is not None:
+            self.evaluator.shutdown()
+            self.evaluator = None
+        return
+
     def init(self):
         """Create and evaluate first generation in the environment
         """
@@ -276,51 +745,134 @@ class EEnvironment():
         """Plot number of generation versus best score of each generation
         Example: ['best_fitness','average_fitness']
         """
-        ticks_generation = list(range(1, self.metadata.current_generation + 1, 1))
+        ticks_generation = list(range(1, len(self.metadata.fitnessss) + 1, 1))
         for metric in metrics:
             if metric == 'best_fitness':
                 plt.plot(ticks_generation,
-                         np.max(np.array(self.metadata.fitnessss), axis=1), label=metric)
+                         np.nanmax(np.array(self.metadata.fitnessss), axis=1), label=metric)
             if metric == 'average_fitness':
                 plt.plot(ticks_generation,
-                         np.mean(np.array(self.metadata.fitnessss), axis=1), label=metric)
+                         np.nanmean(np.array(self.metadata.fitnessss), axis=1), label=metric)
         plt.legend()
         plt.xlabel('No. generation')
         plt.show()
         return
 
     @staticmethod
-    def load(file_name: str, fitness_func: types.FunctionType):
-        file = pathlib.Path(file_name)
-        if file.is_dir():
-            try:
-                funcs = json.load(open(os.path.join(file_name, 'funcs.json')))
-                metadata = json.load(
-                    open(os.path.join(file_name, 'metadata.json')))
-                env = EEnvironment(
-                    metadata=metadata,
-                    generator_func=getattr(generator, funcs['generator_func']),
-                    crossover_func=getattr(crossover, funcs['crossover_func']),
-                    mutate_func=getattr(mutate, funcs['mutate_func']),
-                    selection_func=getattr(selection, funcs['selection_func']),
-                    threshold_func=getattr(threshold, funcs['threshold_func'])
-                )
-                env.circuitss = [[0 for _ in range(env.metadata.num_circuit)] for _ in range(
-                    env.metadata.current_generation)]
-                env.best_circuits = [0]*(env.metadata.current_generation)
-                for i in range(0, env.metadata.current_generation - 1):
-                    env.best_circuits[i] = utilities.load_circuit(os.path.join(file_name, f'best_circuit_{i + 1}'))
-                    for j in range(env.metadata.num_circuit):
-                        env.circuitss[i][j] = utilities.load_circuit(os.path.join(file_name, f'circuit_{i + 1}_{j}'))
-                env.set_fitness_func(fitness_func)
-                env.set_circuits(env.circuitss[-1])
-            except:
-                return
-            env.best_circuit = utilities.load_circuit((os.path.join(file_name, 'best_circuit')))
+    def load(file_name: str, fitness_func: types.FunctionType, circuit_cache_size: int = 64, convert: bool = False, **kwargs):
+        """Load an environment saved by save. A generation which was not completed
+        (crash between the two saves of a generation) stays in the fitness history but not in
+        current_generation, evol then computes it again from the last completed generation with the
+        same random state, population, cached fitness values and best-so-far record as the original run.
+        The random state is restored by evol, so loading a run to inspect it does not change the global random generators. circuitss and best_circuits are lazy:
+        a circuit is deserialized when it is accessed, only the last generation is read at load.
+        The folder is not modified, an old folder (one qpy file per circuit) is converted to the archive
+        and checkpoint format by the next save.
 
-        else:
+        Args:
+            - file_name (str): Path of env folder
+            - fitness_func (types.FunctionType)
+            - circuit_cache_size (int, optional): Number of deserialized circuits kept in memory, not to be confused with cache_size of EEnvironment (fitness values). Defaults to 64.
+            - convert (bool, optional): Convert an old folder at load. Defaults to False.
+            - kwargs: other arguments of EEnvironment, ex: cache_size, dataset or functions which can not be found by name (crossover_func=crossover.onepoint(...))
+
+        Returns:
+            - EEnvironment
+        """
+        file = pathlib.Path(file_name)
+        if not file.is_dir():
             raise TypeError("Please input a path to env folder")
+        saved_funcs = json.load(open(os.path.join(file_name, 'funcs.json')))
+        metadata = json.load(open(os.path.join(file_name, 'metadata.json')))
+        metadata_class = METADATA_CLASSES.get(saved_funcs.get('metadata_class'))
+        if metadata_class is None:
+            metadata_class = MetadataSynthesis if 'num_cnot' in metadata else (
+                MetadataCompilation if 'depth' in metadata else Metadata)
+        records = []
+        if os.path.exists(os.path.join(file_name, 'checkpoint.jsonl')):
+            with open(os.path.join(file_name, 'checkpoint.jsonl')) as file:
+                records = [json.loads(line) for line in file if line.strip() != '']
+        if len(records) > 0:
+            # A resumed run writes again the generation which was not completed,
+            # each record replaces the values from its start generation
+            metadata['fitnessss'], metadata['best_fitnesss'] = [], []
+            for record in records:
+                start = record.get('start', len(metadata['fitnessss']))
+                metadata['fitnessss'][start:] = record['fitnessss']
+                metadata['best_fitnesss'][start:] = record['best_fitnesss']
+            num_generation = records[-1]['num_circuitss']
+        else:
+            # Old folders, metadata.json has the whole history, a generation is completed
+            # when the circuits of the next population are on disk
+            num_circuitss = 0
+            while os.path.exists(os.path.join(file_name, f'circuit_{num_circuitss + 1}_0.qpy')):
+                num_circuitss += 1
+            num_generation = min(len(metadata['fitnessss']), num_circuitss)
+        metadata['current_generation'] = num_generation
+        modules = {
+            'generator_func': generator,
+            'crossover_func': crossover,
+            'mutate_func': mutate,
+            'selection_func': selection,
+            'threshold_func': threshold
+        }
+        for name, module in modules.items():
+            if name not in kwargs:
+                kwargs[name] = getattr(module, saved_funcs[name], None)
+                if not callable(kwargs[name]):
+                    raise ValueError(
+                        f"{name} '{saved_funcs[name]}' of {file_name} is not found in {module.__name__}, "
+                        f"please pass it to load, ex: EEnvironment.load(file_name, fitness_func, {name}=...)")
+        env = EEnvironment(metadata=metadata_class(**metadata), **kwargs)
+        env.set_fitness_func(fitness_func)
+        if CircuitArchive.exists(file_name):
+            env.archive = CircuitArchive(file_name)
+            read = env.archive.get
+        else:
+            # Old folders, one qpy file per circuit
+            def read(name): return utilities.load_circuit(os.path.join(file_name, name))
+        # Circuits are only read when they are accessed
+        loader = CircuitLoader(read, max_size=circuit_cache_size)
+        env.circuitss = [
+            LazyCircuits(loader, [f'circuit_{i + 1}_{j}' for j in range(env.metadata.num_circuit)])
+            for i in range(num_generation)]
+        env.best_circuits = LazyCircuits(
+            loader, [f'best_circuit_{i + 1}' for i in range(len(env.metadata.best_fitnesss))])
+        if len(env.metadata.best_fitnesss) > 0:
+            env.best_fitness = np.max(env.metadata.best_fitnesss)
+        if num_generation > 0:
+            env.set_circuits(list(env.circuitss[-1]))
+        elif env.archive is not None and 'circuit_0_0' in env.archive:
+            # Initial population, saved before it was scored
+            env.set_circuits([env.archive.get(f'circuit_0_{j}') for j in range(env.metadata.num_circuit)])
+        for record in records:
+            for key, fitness in record.get('fitness_values', {}).items():
+                env.fitness_cache.put(key, fitness)
+        if len(records) > 0:
+            env.best_fitness = records[-1]['best_fitness']
+            # The global random generators are only restored when evol resumes the run
+            env.random_state = records[-1]['random_state']
+        if env.archive is not None and 'best_circuit' in env.archive:
+            env.best_circuit = env.archive.get('best_circuit')
+        elif env.archive is None and os.path.exists(os.path.join(file_name, 'best_circuit.qpy')):
+            env.best_circuit = utilities.load_circuit(os.path.join(file_name, 'best_circuit'))
+        # Continue saving into the same folder, without rewriting loaded generations
+        env.set_filename(file_name)
+        env.num_saved = {
+            'file_name': file_name,
+            'circuitss': num_generation,
+            'best_circuits': num_generation,
+            'fitnessss': num_generation,
+            'best_circuit': env.best_circuit,
+            'population': True
+        }
+        if env.archive is None:
+            # Old folders are converted to the archive and checkpoint format by the next save
+            env.num_saved = {}
+            if convert:
+                env.save()
         return env
+
     def draw(self, file_name: str = None):
         fig, ax = plt.subplots(len(self.circuitss),self.metadata.num_circuit)
         for i in range(0, len(self.circuitss)):
@@ -341,7 +893,11 @@ class EEnvironment():
         return  
     
     def save(self, file_name: str = ''):
-        """Save as envobj file at a specific path
+        """Save as envobj file at a specific path. Saving is incremental: only circuits and
+        fitness values which are not in the folder yet are written, circuits are appended to
+        one packed archive (see archive.CircuitArchive), and one line is appended
+        to checkpoint.jsonl (new fitness values, number of saved generations, best fitness and
+        random state), so the cost of a save does not grow with the number of generations.
 
         Args:
             file_name (str): Path
@@ -353,34 +909,72 @@ class EEnvironment():
     
         if not os.path.exists(file_name):
             os.mkdir(file_name)
-
-        funcs = {
-            'generator_func': self.generator_func.__name__,
-            'fitness_func': self.fitness_func.__name__,
-            'crossover_func': self.crossover_func.__name__,
-            'mutate_func': self.mutate_func.__name__,
-            'selection_func': self.selection_func.__name__,
-            'threshold_func': self.threshold_func.__name__
-        }
+        if self.num_saved.get('file_name') != file_name:
+            self.num_saved = {
+                'file_name': file_name,
+                'circuitss': 0,
+                'best_circuits': 0,
+                'fitnessss': 0,
+                'best_circuit': None,
+                'population': False
+            }
+            # Fitness values computed before the first save
+            self.unsaved_fitnesss.update(self.fitness_cache.values)
+            funcs = {
+                'generator_func': self.generator_func.__name__,
+                'fitness_func': self.fitness_func.__name__,
+                'crossover_func': self.crossover_func.__name__,
+                'mutate_func': self.mutate_func.__name__,
+                'selection_func': self.selection_func.__name__,
+                'threshold_func': self.threshold_func.__name__,
+                'metadata_class': type(self.metadata).__name__
+            }
+            with open(f"{os.path.join(file_name, 'funcs')}.json", "w") as file:
+                json.dump(funcs, file)
+            # A previous run in the same folder is overwritten
+            open(os.path.join(file_name, 'checkpoint.jsonl'), 'w').close()
+            self.archive = CircuitArchive(file_name)
+            self.archive.clear()
+        # Fitness values grow with generations, they are stored in checkpoint.jsonl
+        metadata = vars(self.metadata).copy()
+        metadata['fitnessss'] = []
+        metadata['best_fitnesss'] = []
         with open(f"{os.path.join(file_name, 'metadata')}.json", "w") as file:
-            json.dump(vars(self.metadata), file)
-        with open(f"{os.path.join(file_name, 'funcs')}.json", "w") as file:
-            json.dump(funcs, file)
+            json.dump(metadata, file)
         print(f"Saving circuit ...")
-        for i in range(0, len(self.circuitss)):
+        items = []
+        if len(self.circuitss) == 0 and len(self.circuits) > 0 and not self.num_saved['population']:
+            # Initial population, so a run stopped in the first generation does not create new circuits
+            items.extend([(f'circuit_0_{j}', circuit) for j, circuit in enumerate(self.circuits)])
+            self.num_saved['population'] = True
+        for i in range(self.num_saved['circuitss'], len(self.circuitss)):
             for j in range(self.metadata.num_circuit):
-                utilities.save_circuit(
-                    qc=self.circuitss[i][j],
-                    file_name=os.path.join(file_name, f'circuit_{i + 1}_{j}')
-                )
-        for i in range(0, len(self.best_circuits)):
-            utilities.save_circuit(
-                    qc=self.best_circuits[i],
-                    file_name=os.path.join(file_name, f'best_circuit_{i + 1}')
-                )
-        if self.best_circuit is not None:
-            utilities.save_circuit(
-                qc=self.best_circuit,
-                file_name=os.path.join(file_name, f'best_circuit')
-            )
-        return
\ No newline at end of file
+                items.append((f'circuit_{i + 1}_{j}', self.circuitss[i][j]))
+        for i in range(self.num_saved['best_circuits'], len(self.best_circuits)):
+            items.append((f'best_circuit_{i + 1}', self.best_circuits[i]))
+        if self.best_circuit is not None and self.best_circuit is not self.num_saved['best_circuit']:
+            items.append(('best_circuit', self.best_circuit))
+        self.archive.put_many(items)
+        record = {
+            'current_generation': self.metadata.current_generation,
+            # First generation of fitnessss and best_fitnesss, load keeps the latest values of a generation
+            'start': self.num_saved['fitnessss'],
+            'num_circuitss': len(self.circuitss),
+            'num_best_circuits': len(self.best_circuits),
+            'fitnessss': [list(map(float, fitnesss)) for fitnesss in self.metadata.fitnessss[self.num_saved['fitnessss']:]],
+            'best_fitnesss': list(map(float, self.metadata.best_fitnesss[self.num_saved['fitnessss']:])),
+            'best_fitness': float(self.best_fitness),
+            'random_state': get_random_state(),
+            # Fitness values computed since the previous save, circuit key -> fitness
+            'fitness_values': {key: float(fitness) for key, fitness in self.unsaved_fitnesss.items()}
+        }
+        with open(os.path.join(file_name, 'checkpoint.jsonl'), 'a') as file:
+            file.write(json.dumps(record) + '\n')
+        self.unsaved_fitnesss = {}
+        self.num_saved.update({
+            'circuitss': len(self.circuitss),
+            'best_circuits': len(self.best_circuits),
+            'fitnessss': len(self.metadata.fitnessss),
+            'best_circuit': self.best_circuit
+        })
+        return
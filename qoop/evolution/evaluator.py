@@ -0,0 +1,196 @@
+import os
+import typing
+import types
+import weakref
+import itertools
+import qiskit
+import numpy as np
+import concurrent.futures
+from multiprocessing import shared_memory
+from ..backend import utilities
+
+# State of a worker process, set once by _initialize_worker
+_fitness_func = None
+_dataset = {}
+_blocks = []
+
+
+def to_arrays(dataset: typing.Dict) -> typing.Dict:
+    """Convert array-like values of a dataset (pandas objects, lists) to numpy arrays,
+    values which are not numeric arrays (ex: labels as objects) are kept
+
+    Args:
+        - dataset (typing.Dict): name -> value
+
+    Returns:
+        - typing.Dict: name -> array
+    """
+    arrays = {}
+    for name, value in dataset.items():
+        array = np.asarray(value) if hasattr(value, '__len__') and not isinstance(value, str) else None
+        arrays[name] = value if array is None or array.dtype.hasobject else array
+    return arrays
+
+
+class SharedDataset():
+    """Numpy arrays copied once into shared memory, workers attach to them
+    and get zero-copy read-only views instead of unpickling the data.
+    Values which are not numeric arrays (ex: labels as strings) are pickled as usual.
+    """
+
+    def __init__(self, dataset: typing.Dict) -> None:
+        """
+        Args:
+            - dataset (typing.Dict): name -> array (numpy, pandas or list)
+        """
+        self.blocks = []
+        # name -> (shared memory name, shape, dtype)
+        self.specs = {}
+        self.others = {}
+        for name, value in to_arrays(dataset).items():
+            if not isinstance(value, np.ndarray):
+                self.others[name] = value
+                continue
+            array = np.ascontiguousarray(value)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+        return
+
+    @staticmethod
+    def attach(specs: typing.Dict, others: typing.Dict) -> typing.Dict:
+        """Rebuild the dataset from shared memory inside a worker
+
+        Args:
+            - specs (typing.Dict): SharedDataset.specs
+            - others (typing.Dict): SharedDataset.others
+
+        Returns:
+            - typing.Dict: name -> array
+        """
+        dataset = dict(others)
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            # Keep the block opened as long as the worker lives
+            _blocks.append(block)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            dataset[name] = array
+        return dataset
+
+    def close(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+        return
+
+
+def _initialize_worker(fitness_func: types.FunctionType, specs: typing.Dict, others: typing.Dict) -> None:
+    global _fitness_func, _dataset
+    _fitness_func = fitness_func
+    _dataset = SharedDataset.attach(specs, others)
+    return
+
+
+def _evaluate(data: bytes, kwargs: typing.Dict = {}) -> float:
+    if getattr(_fitness_func, 'is_batch', False):
+        return _fitness_func([utilities.circuit_from_bytes(data)], **_dataset, **kwargs)[0]
+    return _fitness_func(utilities.circuit_from_bytes(data), **_dataset, **kwargs)
+
+
+def _evaluate_batch(datas: typing.List[bytes], kwargs: typing.Dict = {}) -> typing.List[float]:
+    return _fitness_func([utilities.circuit_from_bytes(data) for data in datas], **_dataset, **kwargs)
+
+
+class ProcessEvaluator():
+    """Long-lived pool of workers computing fitness values.
+    Workers are started once and receive the fitness function once through the pool
+    initializer, the dataset is placed in shared memory, then only qpy bytes of circuits
+    are sent per task.
+    """
+
+    def __init__(self, fitness_func: types.FunctionType, max_workers: int = None,
+                 chunksize: int = 1, dataset: typing.Dict = None) -> None:
+        """
+        Args:
+            - fitness_func (types.FunctionType): f(qc, **dataset) -> float, or a batch function marked by fitness.batch
+            - max_workers (int, optional): Number of worker processes. Defaults to number of CPUs.
+            - chunksize (int, optional): Number of circuits sent to a worker at once. Defaults to 1.
+            - dataset (typing.Dict, optional): Keyword arguments passed to fitness_func. Defaults to None.
+        """
+        self.fitness_func = fitness_func
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.dataset = {} if dataset is None else dataset
+        self.executor = None
+        self.shared_dataset = None
+        return
+
+    def start(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self.executor is None:
+            self.shared_dataset = SharedDataset(self.dataset)
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_initialize_worker,
+                initargs=(self.fitness_func, self.shared_dataset.specs, self.shared_dataset.others))
+            # Stop workers and release shared memory when the evaluator is collected or at interpreter exit
+            self._finalizer = weakref.finalize(
+                self, ProcessEvaluator._release, self.executor, self.shared_dataset)
+        return self.executor
+
+    @staticmethod
+    def _release(executor: concurrent.futures.ProcessPoolExecutor, shared_dataset: SharedDataset) -> None:
+        executor.shutdown()
+        shared_dataset.close()
+        return
+
+    def map(self, circuits: typing.List[qiskit.QuantumCircuit], **kwargs) -> typing.List[float]:
+        """Compute fitness values of circuits, keeping the order
+
+        Args:
+            - circuits (typing.List[qiskit.QuantumCircuit])
+            - kwargs: other arguments of fitness_func, ex: fraction=0.25
+
+        Returns:
+            - typing.List[float]
+        """
+        if len(circuits) == 0:
+            return []
+        datas = [utilities.circuit_to_bytes(circuit) for circuit in circuits]
+        if getattr(self.fitness_func, 'is_batch', False):
+            # One batch per worker
+            num_workers = self.max_workers if self.max_workers is not None else os.cpu_count()
+            size = int(np.ceil(len(datas) / num_workers))
+            batches = [datas[i:i + size] for i in range(0, len(datas), size)]
+            return [fitness for fitnesss in self.start().map(_evaluate_batch, batches, itertools.repeat(kwargs))
+                    for fitness in fitnesss]
+        return list(self.start().map(_evaluate, datas, itertools.repeat(kwargs), chunksize=self.chunksize))
+
+    def submit(self, circuit: qiskit.QuantumCircuit, **kwargs) -> concurrent.futures.Future:
+        """Compute fitness value of one circuit asynchronously
+
+        Args:
+            - circuit (qiskit.QuantumCircuit)
+            - kwargs: other arguments of fitness_func
+
+        Returns:
+            - concurrent.futures.Future
+        """
+        return self.start().submit(_evaluate, utilities.circuit_to_bytes(circuit), kwargs)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self._finalizer()
+            self.executor = None
+            self.shared_dataset = None
+        return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return
@@ -0,0 +1,251 @@
+import time
+import qiskit
+import typing
+import types
+import numpy as np
+from sklearn.svm import SVC, LinearSVC
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from ..core import kernel
+
+
+def batch(fitness_func: types.FunctionType) -> types.FunctionType:
+    """Mark a fitness function which scores a whole population in one call:
+    f(qcs: List[QuantumCircuit], **dataset) -> List[float].
+    EEnvironment calls per-circuit fitness functions (not marked) one by one.
+
+    Args:
+        - fitness_func (types.FunctionType)
+
+    Returns:
+        - types.FunctionType: the same function
+    """
+    fitness_func.is_batch = True
+    return fitness_func
+
+
+def stratified_subsample(X: np.ndarray, y: np.ndarray, fraction: float = 1.0,
+                         random_state: int = 0) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Keep a fraction of the samples with the same class proportions. The same fraction
+    always gives the same subsample, so candidates of a generation are compared on the same data.
+
+    Args:
+        - X (np.ndarray): N x P data
+        - y (np.ndarray): N labels
+        - fraction (float, optional): from 0 to 1. Defaults to 1.0.
+        - random_state (int, optional): Defaults to 0.
+
+    Returns:
+        - typing.Tuple[np.ndarray, np.ndarray]: X, y
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    if fraction >= 1:
+        return X, y
+    num_samples = int(np.ceil(fraction * len(y)))
+    if num_samples >= len(y):
+        return X, y
+    try:
+        X, _, y, _ = train_test_split(X, y, train_size=num_samples, stratify=y, random_state=random_state)
+    except ValueError:
+        # Too few samples to keep every class
+        X, _, y, _ = train_test_split(X, y, train_size=num_samples, random_state=random_state)
+    return X, y
+
+
+def qsvm(qc: qiskit.QuantumCircuit, X_train: np.ndarray, y_train: np.ndarray,
+         X_test: np.ndarray, y_test: np.ndarray, dtype: np.dtype = np.complex128, fraction: float = 1.0) -> float:
+    """Accuracy of a QSVC which uses qc as the feature map. Same result as
+    QSVC(quantum_kernel=QuantumKernel(qc, statevector_simulator)) but the kernels
+    are computed by qoop.core.kernel, without one circuit execution per data pair.
+
+    Args:
+        - qc (qiskit.QuantumCircuit): Feature map, number of parameters must be equal to number of features
+        - X_train (np.ndarray)
+        - y_train (np.ndarray)
+        - X_test (np.ndarray)
+        - y_test (np.ndarray)
+        - dtype (np.dtype, optional): Type of the stored training states. Defaults to np.complex128.
+        - fraction (float, optional): Train on a stratified subsample, used by successive halving in EEnvironment. Defaults to 1.0.
+
+    Returns:
+        - float: test accuracy
+    """
+    X_train, y_train = stratified_subsample(X_train, y_train, fraction)
+    quantum_kernel = kernel.StatevectorKernel(qc, dtype=dtype)
+    svc = SVC(kernel='precomputed')
+    svc.fit(quantum_kernel.fit(X_train), y_train)
+    y_pred = svc.predict(quantum_kernel.evaluate(X_test))
+    return accuracy_score(y_test, y_pred)
+
+
+def qsvm_nystrom(qc: qiskit.QuantumCircuit, X_train: np.ndarray, y_train: np.ndarray,
+                 X_test: np.ndarray, y_test: np.ndarray, num_landmarks: int = 100,
+                 dtype: np.dtype = np.complex128, fraction: float = 1.0) -> float:
+    """Accuracy of a linear SVM on the Nystrom features of the fidelity kernel (see kernel.NystromKernel),
+    for datasets where the N x N Gram matrix is too large
+
+    Args:
+        - qc (qiskit.QuantumCircuit): Feature map
+        - X_train (np.ndarray)
+        - y_train (np.ndarray)
+        - X_test (np.ndarray)
+        - y_test (np.ndarray)
+        - num_landmarks (int, optional): Number of landmark samples. Defaults to 100.
+        - dtype (np.dtype, optional): Type of the stored landmark states. Defaults to np.complex128.
+        - fraction (float, optional): Train on a stratified subsample. Defaults to 1.0.
+
+    Returns:
+        - float: test accuracy
+    """
+    X_train, y_train = stratified_subsample(X_train, y_train, fraction)
+    quantum_kernel = kernel.NystromKernel(qc, num_landmarks=num_landmarks, dtype=dtype)
+    svc = LinearSVC(dual='auto')
+    svc.fit(quantum_kernel.fit(X_train), y_train)
+    y_pred = svc.predict(quantum_kernel.transform(X_test))
+    return accuracy_score(y_test, y_pred)
+
+
+def benchmark_nystrom(qc: qiskit.QuantumCircuit, X_train: np.ndarray, y_train: np.ndarray,
+                      X_test: np.ndarray, y_test: np.ndarray,
+                      num_landmarkss: typing.List[int] = [25, 50, 100, 200]) -> typing.List[typing.Dict]:
+    """Compare accuracy and time of the exact kernel (qsvm) with Nystrom approximations
+
+    Args:
+        - qc (qiskit.QuantumCircuit): Feature map
+        - X_train (np.ndarray)
+        - y_train (np.ndarray)
+        - X_test (np.ndarray)
+        - y_test (np.ndarray)
+        - num_landmarkss (typing.List[int], optional): Numbers of landmarks. Defaults to [25, 50, 100, 200].
+
+    Returns:
+        - typing.List[typing.Dict]: {'num_landmarks': m (None for the exact kernel), 'accuracy': ..., 'time': seconds}
+    """
+    results = []
+    for num_landmarks in [None] + list(num_landmarkss):
+        start = time.perf_counter()
+        if num_landmarks is None:
+            accuracy = qsvm(qc, X_train, y_train, X_test, y_test)
+        else:
+            accuracy = qsvm_nystrom(qc, X_train, y_train, X_test, y_test, num_landmarks=num_landmarks)
+        results.append({
+            'num_landmarks': num_landmarks,
+            'accuracy': accuracy,
+            'time': time.perf_counter() - start
+        })
+    return results
+
+
+@batch
+def qsvm_batch(qcs: typing.List[qiskit.QuantumCircuit], X_train: np.ndarray, y_train: np.ndarray,
+               X_test: np.ndarray, y_test: np.ndarray, dtype: np.dtype = np.complex128,
+               fraction: float = 1.0) -> typing.List[float]:
+    """Batch version of qsvm. Train and test samples of a circuit are encoded in one
+    simulation, then the Gram and test kernels of all circuits come from one batched matrix product.
+
+    Args:
+        - qcs (typing.List[qiskit.QuantumCircuit]): Feature maps with the same number of qubits
+        - X_train (np.ndarray)
+        - y_train (np.ndarray)
+        - X_test (np.ndarray)
+        - y_test (np.ndarray)
+        - dtype (np.dtype, optional): Type of the stored states. Defaults to np.complex128.
+        - fraction (float, optional): Train on a stratified subsample. Defaults to 1.0.
+
+    Returns:
+        - typing.List[float]: test accuracies
+    """
+    if len(qcs) == 0:
+        return []
+    X_train, y_train = stratified_subsample(X_train, y_train, fraction)
+    num_train = len(X_train)
+    X = np.concatenate([np.asarray(X_train), np.asarray(X_test)])
+    # C x (N + M) x 2^n
+    psis = np.stack([kernel.statevectors(qc, X, dtype=dtype) for qc in qcs])
+    psi_train = psis[:, :num_train]
+    kernels = np.abs(np.matmul(np.conjugate(psis), psi_train.transpose(0, 2, 1)))**2
+    accuracies = []
+    for K in kernels:
+        svc = SVC(kernel='precomputed')
+        svc.fit(K[:num_train], y_train)
+        accuracies.append(accuracy_score(y_test, svc.predict(K[num_train:])))
+    return accuracies
+
+
+def _target_alignment(kernels: np.ndarray, y: np.ndarray, centered: bool = False) -> np.ndarray:
+    """Kernel-target alignment <K, T>_F / (||K||_F ||T||_F) of one or several kernels.
+    T[i, j] = 1 if y[i] = y[j], else -1 / (C - 1) with C classes, so T = y y^T for labels in {-1, 1}.
+
+    Args:
+        - kernels (np.ndarray): N x N or C x N x N kernels
+        - y (np.ndarray): N labels
+        - centered (bool, optional): Center K and T in feature space (H K H with H = I - 11^T / N). Defaults to False.
+
+    Returns:
+        - np.ndarray: alignments
+    """
+    y = np.asarray(y)
+    num_classes = max(len(np.unique(y)), 2)
+    target = (num_classes * (y[:, None] == y[None, :]) - 1) / (num_classes - 1)
+    if centered:
+        kernels = kernels - kernels.mean(axis=-1, keepdims=True)
+        kernels = kernels - kernels.mean(axis=-2, keepdims=True)
+        target = target - target.mean(axis=-1, keepdims=True)
+        target = target - target.mean(axis=-2, keepdims=True)
+    products = np.sum(kernels * target, axis=(-2, -1))
+    norms = np.linalg.norm(kernels, axis=(-2, -1)) * np.linalg.norm(target)
+    return products / np.where(norms == 0, 1, norms)
+
+
+def alignment(qc: qiskit.QuantumCircuit, X_train: np.ndarray, y_train: np.ndarray,
+              X_test: np.ndarray = None, y_test: np.ndarray = None, centered: bool = False,
+              dtype: np.dtype = np.complex128, fraction: float = 1.0) -> float:
+    """Kernel-target alignment of the fidelity kernel on the training data, a cheap
+    proxy of QSVC accuracy which needs the Gram matrix only (no SVC fit, no test data).
+    Test data are accepted so the same EEnvironment dataset can be used.
+
+    Args:
+        - qc (qiskit.QuantumCircuit): Feature map
+        - X_train (np.ndarray)
+        - y_train (np.ndarray)
+        - X_test (np.ndarray, optional): Not used. Defaults to None.
+        - y_test (np.ndarray, optional): Not used. Defaults to None.
+        - centered (bool, optional): Centered alignment. Defaults to False.
+        - dtype (np.dtype, optional): Type of the states. Defaults to np.complex128.
+        - fraction (float, optional): Use a stratified subsample of the training data. Defaults to 1.0.
+
+    Returns:
+        - float: alignment from -1 to 1
+    """
+    X_train, y_train = stratified_subsample(X_train, y_train, fraction)
+    psi = kernel.statevectors(qc, X_train, dtype=dtype)
+    K = np.abs(np.conjugate(psi) @ psi.T)**2
+    return float(_target_alignment(K, y_train, centered))
+
+
+@batch
+def alignment_batch(qcs: typing.List[qiskit.QuantumCircuit], X_train: np.ndarray, y_train: np.ndarray,
+                    X_test: np.ndarray = None, y_test: np.ndarray = None, centered: bool = False,
+                    dtype: np.dtype = np.complex128, fraction: float = 1.0) -> typing.List[float]:
+    """Batch version of alignment, Gram matrices of all circuits come from one batched matrix product
+
+    Args:
+        - qcs (typing.List[qiskit.QuantumCircuit]): Feature maps with the same number of qubits
+        - X_train (np.ndarray)
+        - y_train (np.ndarray)
+        - X_test (np.ndarray, optional): Not used. Defaults to None.
+        - y_test (np.ndarray, optional): Not used. Defaults to None.
+        - centered (bool, optional): Centered alignment. Defaults to False.
+        - dtype (np.dtype, optional): Type of the states. Defaults to np.complex128.
+        - fraction (float, optional): Use a stratified subsample of the training data. Defaults to 1.0.
+
+    Returns:
+        - typing.List[float]: alignments
+    """
+    if len(qcs) == 0:
+        return []
+    X_train, y_train = stratified_subsample(X_train, y_train, fraction)
+    psis = np.stack([kernel.statevectors(qc, X_train, dtype=dtype) for qc in qcs])
+    kernels = np.abs(np.matmul(np.conjugate(psis), psis.transpose(0, 2, 1)))**2
+    return [float(value) for value in _target_alignment(kernels, y_train, centered)]
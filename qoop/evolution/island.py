@@ -0,0 +1,153 @@
+import queue
+import random
+import typing
+import traceback
+import multiprocessing
+import qiskit
+import numpy as np
+from ..backend import utilities
+from .environment import EEnvironment
+
+
+def _emigrants(env: EEnvironment, num_generation: int, num_migrants: int) -> typing.List[typing.Tuple[bytes, float]]:
+    """Best distinct circuits found by an island during its last generations
+
+    Returns:
+        - typing.List[typing.Tuple[bytes, float]]: (qpy bytes, fitness) pairs
+    """
+    best_circuits = list(env.best_circuits[-num_generation:])
+    best_fitnesss = env.metadata.best_fitnesss[-num_generation:]
+    emigrants = []
+    keys = set()
+    for index in np.argsort(best_fitnesss)[::-1]:
+        key = utilities.circuit_key(best_circuits[index])
+        if key in keys:
+            continue
+        keys.add(key)
+        emigrants.append((utilities.circuit_to_bytes(best_circuits[index]), float(best_fitnesss[index])))
+        if len(emigrants) == num_migrants:
+            break
+    return emigrants
+
+
+def _immigrate(env: EEnvironment, immigrants: typing.List[typing.Tuple[bytes, float]], auto_save: bool) -> None:
+    """Replace the last circuits of the next population, which are the offsprings of the
+    weakest selected parents, by immigrants. Their fitness is known, so they are not scored again.
+    """
+    if len(immigrants) == 0:
+        return
+    immigrants = immigrants[:len(env.circuits)]
+    # env.circuits is also the last recorded generation, it is replaced by a new list
+    circuits = list(env.circuits)
+    for i, (data, fitness) in enumerate(immigrants):
+        circuit = utilities.circuit_from_bytes(data)
+        env.remember_fitness(utilities.circuit_key(circuit), fitness)
+        circuits[len(circuits) - len(immigrants) + i] = circuit
+    env.replace_population(circuits, auto_save)
+    return
+
+
+def _run_island(index: int, env: EEnvironment, seed: int, migration_interval: int, num_migrants: int,
+                inbox: multiprocessing.Queue, outbox: multiprocessing.Queue, results: multiprocessing.Queue,
+                mode: str, auto_save: bool) -> None:
+    try:
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        num_generation = env.metadata.num_generation
+        while env.metadata.current_generation < num_generation:
+            target = min(env.metadata.current_generation + migration_interval, num_generation)
+            env.set_num_generation(target)
+            env.evol(mode=mode, auto_save=auto_save)
+            # The threshold can be reached at the last generation of an interval, the island
+            # then stops before migration replaces its evaluated population
+            if env.is_finished or env.metadata.current_generation < target:
+                break
+            if num_migrants > 0 and env.metadata.current_generation < num_generation:
+                outbox.put(_emigrants(env, migration_interval, num_migrants))
+                # Islands do not wait for each other, migrants which arrived are taken
+                immigrants = []
+                while True:
+                    try:
+                        immigrants.extend(inbox.get_nowait())
+                    except queue.Empty:
+                        break
+                _immigrate(env, immigrants, auto_save)
+        env.close()
+        best_circuit = utilities.circuit_to_bytes(env.best_circuit) if env.best_circuit is not None else None
+        results.put((index, float(env.best_fitness), best_circuit,
+                     [float(fitness) for fitness in env.metadata.best_fitnesss], None))
+    except Exception:
+        results.put((index, None, None, None, traceback.format_exc()))
+    # Migrants for an island which already ended are dropped instead of blocking the exit
+    outbox.cancel_join_thread()
+    return
+
+
+class IslandModel():
+    """Run several EEnvironment populations (islands) in separate processes. Every
+    migration_interval generations, each island sends its best circuits to the next one
+    (ring topology) where they replace the weakest offsprings.
+    With num_migrants = 0, islands are independent, ex: a concurrent prob_mutate sweep:
+    IslandModel([create_env(prob_mutate) for prob_mutate in [0.01, 0.05, 0.1]], num_migrants=0)
+    Islands are started by fork, so closures such as crossover.onepoint(...) can be used.
+    """
+
+    def __init__(self, envs: typing.List[EEnvironment], migration_interval: int = 5,
+                 num_migrants: int = 1, seeds: typing.List[int] = None,
+                 mode: str = 'noparallel', auto_save: bool = False) -> None:
+        """
+        Args:
+            - envs (typing.List[EEnvironment]): islands, ex: same metadata with different mutate_func
+            - migration_interval (int, optional): Number of generations between migrations. Defaults to 5.
+            - num_migrants (int, optional): Number of circuits sent by an island at each migration. Defaults to 1.
+            - seeds (typing.List[int], optional): Random seed of each island. Defaults to None.
+            - mode (str, optional): evol mode inside an island, islands already use one process each. Defaults to 'noparallel'.
+            - auto_save (bool, optional): Save islands, their file names must be different. Defaults to False.
+        """
+        self.envs = envs
+        self.migration_interval = migration_interval
+        self.num_migrants = num_migrants
+        self.seeds = seeds if seeds is not None else list(range(len(envs)))
+        self.mode = mode
+        self.auto_save = auto_save
+        self.best_circuit: qiskit.QuantumCircuit = None
+        self.best_fitness = 0
+        self.best_island = None
+        self.best_fitnesss: typing.List[float] = []
+        self.best_circuits: typing.List[qiskit.QuantumCircuit] = []
+        # best_fitnesss of every island
+        self.best_fitnessss: typing.List[typing.List[float]] = []
+        return
+
+    def evol(self):
+        """Run all islands until num_generation of each one, then merge their results
+        """
+        context = multiprocessing.get_context('fork')
+        queues = [context.Queue() for _ in self.envs]
+        results = context.Queue()
+        processes = []
+        for index, env in enumerate(self.envs):
+            process = context.Process(
+                target=_run_island,
+                args=(index, env, self.seeds[index], self.migration_interval, self.num_migrants,
+                      queues[index], queues[(index + 1) % len(self.envs)], results,
+                      self.mode, self.auto_save))
+            process.start()
+            processes.append(process)
+        # Results are read before join, a process can not exit while its queue is not flushed
+        outputs = sorted([results.get() for _ in processes], key=lambda output: output[0])
+        for process in processes:
+            process.join()
+        for output in outputs:
+            if output[4] is not None:
+                raise RuntimeError(f'Island {output[0]} failed:\n{output[4]}')
+        self.best_fitnesss = [output[1] for output in outputs]
+        self.best_circuits = [utilities.circuit_from_bytes(output[2]) if output[2] is not None else None
+                              for output in outputs]
+        self.best_fitnessss = [output[3] for output in outputs]
+        self.best_island = int(np.argmax(self.best_fitnesss))
+        self.best_fitness = self.best_fitnesss[self.best_island]
+        self.best_circuit = self.best_circuits[self.best_island]
+        print(f'End island evol progress, best score ever: {self.best_fitness} (island {self.best_island})')
+        return self
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import typing
+import hashlib
+import numpy as np
+
+
+def dataset_fingerprint(*arrays, **named_arrays) -> str:
+    """Hash the content of datasets, so fitness values computed on different
+    datasets (or different PCA sizes) never collide in a fitness store
+
+    Args:
+        - arrays: numpy arrays, pandas objects or lists. Ex: X_train, y_train, X_test, y_test
+        - named_arrays: same, hashed with their names in sorted order. Ex: **env.dataset
+
+    Returns:
+        - str: hex digest
+    """
+    sha = hashlib.sha1()
+    items = [(None, array) for array in arrays] + sorted(named_arrays.items(), key=lambda item: item[0])
+    for name, array in items:
+        if name is not None:
+            sha.update(name.encode())
+        array = np.ascontiguousarray(np.asarray(array))
+        sha.update(f'{array.shape}{array.dtype}'.encode())
+        if array.dtype == object:
+            # Bytes of object arrays are addresses
+            sha.update(repr(array.tolist()).encode())
+        else:
+            sha.update(array.tobytes())
+    return sha.hexdigest()
+
+
+class SQLiteFitnessStore():
+    """Persistent fitness store shared across runs, sweeps and processes.
+    Every value is keyed by (circuit key, fitness function name, dataset fingerprint).
+    The fingerprint is required: a fitness function which reads its data from a closure has the same
+    name for every dataset, ex: SQLiteFitnessStore(path, fingerprint=dataset_fingerprint(X_train, y_train)).
+    Any object with the same get / put methods can be plugged into EEnvironment.
+    """
+
+    def __init__(self, path: str, fingerprint: str = '', timeout: float = 60) -> None:
+        """
+        Args:
+            - path (str): SQLite file, ex: os.path.join(run_folder, 'fitness.sqlite')
+            - fingerprint (str, optional): dataset_fingerprint of the data used by the fitness function, set by attach when the environment has a dataset. Any fixed string for a fitness function which does not use data, ex: 'compilation'. Defaults to ''.
+            - timeout (float, optional): Seconds to wait for a concurrent writer. Defaults to 60.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+        folder = os.path.dirname(path)
+        if folder != '' and not os.path.exists(folder):
+            os.makedirs(folder)
+        with self.connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS fitness ('
+                'circuit_key TEXT, fitness_func TEXT, fingerprint TEXT, fitness REAL, '
+                'PRIMARY KEY (circuit_key, fitness_func, fingerprint))')
+        return
+
+    def connect(self) -> sqlite3.Connection:
+        """Open one connection per process, WAL mode allows readers and writers
+        from the process pool to work at the same time.
+
+        Returns:
+            - sqlite3.Connection
+        """
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str, fitness_name: str):
+        """Return the stored fitness value or None
+
+        Args:
+            - key (str): circuit key
+            - fitness_name (str): name of fitness function
+
+        Returns:
+            - float | None
+        """
+        self.check_fingerprint()
+        row = self.connect().execute(
+            'SELECT fitness FROM fitness WHERE circuit_key = ? AND fitness_func = ? AND fingerprint = ?',
+            (key, fitness_name, self.fingerprint)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def check_fingerprint(self) -> None:
+        if self.fingerprint == '':
+            raise ValueError(
+                'The fitness store has no fingerprint, values of different datasets would be shared. '
+                'Pass a dataset to EEnvironment or SQLiteFitnessStore(path, fingerprint=dataset_fingerprint(X_train, y_train, ...))')
+        return
+
+    def attach(self, dataset: typing.Dict) -> None:
+        """Key the stored values by the dataset of an environment, called by EEnvironment
+        when the store is attached. A fingerprint given to the constructor must match it.
+
+        Args:
+            - dataset (typing.Dict): keyword arguments of the fitness function, an empty dataset keeps the given fingerprint, which is then required
+        """
+        if len(dataset) == 0:
+            self.check_fingerprint()
+            return
+        fingerprint = dataset_fingerprint(**dataset)
+        if self.fingerprint not in ('', fingerprint):
+            raise ValueError(
+                f'The fingerprint of the fitness store ({self.fingerprint}) does not match the dataset '
+                f'of the environment ({fingerprint}), use dataset_fingerprint(**dataset) or one store per dataset')
+        self.fingerprint = fingerprint
+        return
+
+    def put(self, key: str, fitness_name: str, fitness: float) -> None:
+        """Store a fitness value
+
+        Args:
+            - key (str): circuit key
+            - fitness_name (str): name of fitness function
+            - fitness (float)
+        """
+        self.check_fingerprint()
+        with self.connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO fitness VALUES (?, ?, ?, ?)',
+                (key, fitness_name, self.fingerprint, float(fitness)))
+        return
+
+    def __len__(self) -> int:
+        return self.connect().execute('SELECT COUNT(*) FROM fitness').fetchone()[0]
+
+    def __getstate__(self):
+        # Connections can not be pickled, each process opens its own one
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pid'] = None
+        return state
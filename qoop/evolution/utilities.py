@@ -64,4 +64,30 @@ def sort_by_fitness(objects: list, fitnesss: list):
     combined_list = list(zip(objects, fitnesss))
     sorted_combined_list = sorted(combined_list, key=lambda x: x[1], reverse=True)
     sorted_object = [item[0] for item in sorted_combined_list]
-    return sorted_object
\ No newline at end of file
+    return sorted_object
+
+def get_random_state() -> dict:
+    """State of the Python and NumPy random generators, as JSON serializable lists
+
+    Returns:
+        - dict: {'random': ..., 'numpy': ...}
+    """
+    version, internal_state, gauss = random.getstate()
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        'random': [version, list(internal_state), gauss],
+        'numpy': [name, keys.tolist(), int(position), int(has_gauss), float(cached_gaussian)]
+    }
+
+
+def set_random_state(state: dict) -> None:
+    """Restore the random generators from get_random_state
+
+    Args:
+        - state (dict): {'random': ..., 'numpy': ...}
+    """
+    version, internal_state, gauss = state['random']
+    random.setstate((version, tuple(internal_state), gauss))
+    name, keys, position, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+    return
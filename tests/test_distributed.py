@@ -0,0 +1,61 @@
+import os
+import time
+import pytest
+import qiskit
+from qoop.evolution.distributed import DistributedEvaluator
+
+
+def num_gates(qc, folder):
+    return float(len(qc.data))
+
+
+def slow_first_call(qc, folder):
+    # The first call is slower than the lease, the task is sent again to the other worker
+    with open(os.path.join(folder, 'calls'), 'a') as file:
+        file.write('call\n')
+    try:
+        os.mkdir(os.path.join(folder, 'first'))
+        time.sleep(1.5)
+    except FileExistsError:
+        pass
+    return float(len(qc.data))
+
+
+def never_ends(qc, folder):
+    time.sleep(30)
+    return 0.0
+
+
+def create_circuit(num_gates):
+    qc = qiskit.QuantumCircuit(2)
+    for _ in range(num_gates):
+        qc.h(0)
+    return qc
+
+
+def test_map(tmp_path):
+    with DistributedEvaluator(num_gates, dataset={'folder': str(tmp_path)}, num_local_workers=2) as evaluator:
+        assert evaluator.map([create_circuit(i) for i in range(5)]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert evaluator.pending == {}
+
+
+def test_expired_lease_is_sent_again_and_duplicate_is_ignored(tmp_path):
+    with DistributedEvaluator(slow_first_call, dataset={'folder': str(tmp_path)},
+                              num_local_workers=2, lease_timeout=0.3) as evaluator:
+        assert evaluator.submit(create_circuit(3)).result(timeout=10) == 3.0
+        # Late result of the first send
+        time.sleep(2)
+        assert evaluator.pending == {}
+        assert evaluator.map([create_circuit(1), create_circuit(2)]) == [1.0, 2.0]
+    with open(tmp_path / 'calls') as file:
+        # Two sends of the first task, one of each other task
+        assert len(file.readlines()) >= 4
+
+
+def test_max_retries(tmp_path):
+    with DistributedEvaluator(never_ends, dataset={'folder': str(tmp_path)},
+                              num_local_workers=2, lease_timeout=0.2, max_retries=1) as evaluator:
+        future = evaluator.submit(create_circuit(1))
+        with pytest.raises(TimeoutError):
+            future.result(timeout=10)
+        assert evaluator.pending == {}
@@ -0,0 +1,291 @@
+import random
+import contextlib
+import io
+import json
+import pathlib
+import shutil
+import numpy as np
+import pytest
+import qiskit
+import qiskit.quantum_info as qi
+from qoop.evolution.environment_synthesis import MetadataSynthesis
+from qoop.evolution.environment import EEnvironment, FitnessCache
+from qoop.evolution import crossover, divider, generator, mutate, normalizer, selection
+from qoop.backend import constant, utilities
+
+
+def fitness(qc):
+    return float(np.abs(qi.Statevector(qc.assign_parameters(np.ones(qc.num_parameters))).data[0])**2)
+
+
+FUNCS = {
+    'crossover_func': crossover.onepoint(divider.by_num_rotation_gate(2), normalizer.by_num_rotation_gate(4)),
+    'mutate_func': mutate.bitflip_mutate_with_normalizer(
+        constant.operations_with_rotations, normalizer_func=normalizer.by_num_rotation_gate(4)),
+    'threshold_func': lambda fitness: False
+}
+
+
+def create_env(file_name, num_generation=4, **kwargs):
+    random.seed(3)
+    np.random.seed(3)
+    metadata = MetadataSynthesis(num_qubits=4, num_cnot=3, num_rx=1, num_ry=1, num_rz=2, depth=4,
+                                 num_circuit=4, num_generation=num_generation, prob_mutate=0.2)
+    env = EEnvironment(metadata=metadata, fitness_func=fitness,
+                       generator_func=generator.by_num_rotations_and_cnot, **dict(FUNCS, **kwargs))
+    env.set_filename(str(file_name))
+    return env
+
+
+def load_env(file_name):
+    return EEnvironment.load(str(file_name), fitness, selection_func=selection.elitist_selection, **FUNCS)
+
+
+def evol(env):
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.evol(mode='serial')
+    return env
+
+
+def keys(circuits):
+    return [utilities.circuit_key(circuit) for circuit in circuits]
+
+
+def assert_same_run(env, reference):
+    assert env.metadata.current_generation == reference.metadata.current_generation
+    assert np.array_equal(env.metadata.fitnessss, reference.metadata.fitnessss)
+    assert env.metadata.best_fitnesss == reference.metadata.best_fitnesss
+    assert env.best_fitness == reference.best_fitness
+    assert keys(env.circuits) == keys(reference.circuits)
+    assert keys(env.best_circuits) == keys(reference.best_circuits)
+    assert [keys(circuits) for circuits in env.circuitss] == [keys(circuits) for circuits in reference.circuitss]
+
+
+def test_fitness_cache_hits_and_misses():
+    cache = FitnessCache(2)
+    assert cache.get('a') is None
+    cache.put('a', 0.5)
+    assert cache.get('a') == 0.5
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.clear()
+    assert len(cache) == cache.hits == cache.misses == 0
+
+
+def test_fitness_cache_evicts_least_recently_used():
+    cache = FitnessCache(2)
+    cache.put('a', 0.1)
+    cache.put('b', 0.2)
+    cache.get('a')
+    cache.put('c', 0.3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (0.1, 0.3)
+    disabled = FitnessCache(0)
+    disabled.put('a', 0.1)
+    assert disabled.get('a') is None
+
+
+def two_rotations(first, second):
+    qc = qiskit.QuantumCircuit(2)
+    qc.rx(first, 0)
+    qc.rx(second, 1)
+    return qc
+
+
+def test_circuit_key_follows_parameter_binding():
+    a, b = qiskit.circuit.Parameter('a'), qiskit.circuit.Parameter('b')
+    c, d = qiskit.circuit.Parameter('c'), qiskit.circuit.Parameter('d')
+    # Parameter names do not matter
+    assert utilities.circuit_key(two_rotations(a, b)) == utilities.circuit_key(two_rotations(c, d))
+    # One shared parameter is another circuit than two independent ones
+    assert utilities.circuit_key(two_rotations(a, a)) != utilities.circuit_key(two_rotations(a, b))
+    assert utilities.circuit_key(two_rotations(a, 2 * b)) != utilities.circuit_key(two_rotations(a, b))
+    assert utilities.circuit_key(two_rotations(0.1, 0.2)) != utilities.circuit_key(two_rotations(0.1, 0.3))
+
+
+def test_evaluate_uses_fitness_cache(tmp_path):
+    circuits = []
+
+    def counted_fitness(qc):
+        circuits.append(qc)
+        return fitness(qc)
+
+    env = create_env(tmp_path / 'run')
+    env.set_fitness_func(counted_fitness)
+    qc = env.generator_func(env.metadata)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert env.evaluate([qc, qc.copy()], mode='serial') == [fitness(qc)] * 2
+        env.evaluate([qc], mode='serial')
+    assert len(circuits) == 1
+    assert env.fitness_cache.hits == 1
+
+
+@pytest.fixture
+def reference(tmp_path):
+    return evol(create_env(tmp_path / 'reference'))
+
+
+def test_save_load_round_trip(tmp_path, reference):
+    assert_same_run(load_env(tmp_path / 'reference'), reference)
+
+
+def test_load_cache_sizes(tmp_path, reference):
+    env = EEnvironment.load(str(tmp_path / 'reference'), fitness, circuit_cache_size=2, cache_size=8,
+                            selection_func=selection.elitist_selection, **FUNCS)
+    assert env.fitness_cache.max_size == 8
+    assert env.circuitss[0].loader.max_size == 2
+
+
+def test_resume_after_stop(tmp_path, reference):
+    evol(create_env(tmp_path / 'run', num_generation=2))
+    random.seed(99)
+    np.random.seed(99)
+    env = load_env(tmp_path / 'run')
+    assert env.metadata.current_generation == 2
+    env.set_num_generation(4)
+    assert_same_run(evol(env), reference)
+    assert_same_run(load_env(tmp_path / 'run'), reference)
+
+
+def test_load_keeps_global_random_state(tmp_path):
+    evol(create_env(tmp_path / 'run', num_generation=2))
+    random.seed(99)
+    np.random.seed(99)
+    expected = random.random(), np.random.rand()
+    random.seed(99)
+    np.random.seed(99)
+    load_env(tmp_path / 'run')
+    assert (random.random(), np.random.rand()) == expected
+
+
+def test_resume_after_crash_between_saves(tmp_path, reference):
+    num_calls = []
+
+    def crashed_selection(circuits, fitnesss):
+        # Crash in generation 3, after its fitness values are saved
+        num_calls.append(1)
+        if len(num_calls) == 3:
+            raise KeyboardInterrupt
+        return selection.elitist_selection(circuits, fitnesss)
+
+    with pytest.raises(KeyboardInterrupt):
+        evol(create_env(tmp_path / 'run', selection_func=crashed_selection))
+    env = load_env(tmp_path / 'run')
+    assert env.metadata.current_generation == 2
+    # The fitness values of generation 3 are kept in the history
+    assert len(env.metadata.fitnessss) == 3
+    assert_same_run(evol(env), reference)
+    assert_same_run(load_env(tmp_path / 'run'), reference)
+
+
+def test_resume_steady_state(tmp_path):
+    env = create_env(tmp_path / 'run', num_generation=2, max_workers=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.evol(mode='steady_state')
+    env.close()
+    population = keys(env.circuits)
+    env = EEnvironment.load(str(tmp_path / 'run'), fitness, max_workers=2,
+                            selection_func=selection.elitist_selection, **FUNCS)
+    env.set_num_generation(4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        env.evol(mode='steady_state')
+    env.close()
+    assert env.metadata.current_generation == len(env.metadata.fitnessss) == 4
+    # Every offspring is looked up once, the restored population too but outside the budget
+    assert env.fitness_cache.hits + env.fitness_cache.misses == len(population) + 2 * env.metadata.num_circuit
+
+
+def test_pruned_circuits_are_not_in_fitness_history(tmp_path):
+    env = create_env(tmp_path / 'run', num_generation=2)
+    env.set_prefilter(lambda qc: float(qc.depth()))
+    evol(env)
+    # circuitss[i] is the population scored at generation i + 2
+    for fitnesss, circuits in zip(env.metadata.fitnessss[1:], env.circuitss):
+        pruned = np.isnan(fitnesss)
+        assert 0 < np.sum(pruned) < len(fitnesss)
+        assert [fitness(circuit) for circuit, is_pruned in zip(circuits, pruned) if not is_pruned] \
+            == [value for value, is_pruned in zip(fitnesss, pruned) if not is_pruned]
+    assert env.metadata.best_fitnesss == list(np.nanmax(env.metadata.fitnessss, axis=1))
+    assert np.array_equal(load_env(tmp_path / 'run').metadata.fitnessss, env.metadata.fitnessss, equal_nan=True)
+
+
+def test_successive_halving(tmp_path):
+    fractions = []
+
+    def subsampled_fitness(qc, fraction=1.0):
+        fractions.append(fraction)
+        return fitness(qc) * fraction
+
+    env = create_env(tmp_path / 'run')
+    env.set_fitness_func(subsampled_fitness)
+    env.set_successive_halving([0.25, 0.5])
+    circuits = [env.generator_func(env.metadata) for _ in range(8)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        fitnesss = env.evaluate(circuits, mode='serial')
+    # 8 circuits on 1 / 4 of the data, the best 4 on half of it, the best 2 on the full data
+    assert fractions == [0.25] * 8 + [0.5] * 4 + [1.0] * 2
+    order = np.argsort([fitness(circuit) for circuit in circuits])[::-1]
+    assert sorted(env.pruned_indexes) == sorted(order[2:])
+    assert [fitnesss[i] for i in order[:2]] == [fitness(circuits[i]) for i in order[:2]]
+    assert max(fitnesss[i] for i in order[2:]) < min(fitnesss[i] for i in order[:2])
+
+
+def array_fitness(qc, X_train, y_train):
+    return float(isinstance(X_train, np.ndarray) and isinstance(y_train, np.ndarray))
+
+
+def test_dataset_types_do_not_depend_on_mode(tmp_path):
+    pandas = pytest.importorskip('pandas')
+    env = create_env(tmp_path / 'run', max_workers=1,
+                     dataset={'X_train': pandas.DataFrame(np.ones((4, 2))), 'y_train': [0, 1, 0, 1]})
+    env.set_fitness_func(array_fitness)
+    circuits = [env.generator_func(env.metadata) for _ in range(2)]
+    assert env.compute(circuits, mode='serial') == env.compute(circuits, mode='parallel') == [1.0, 1.0]
+    env.close()
+
+
+LEGACY_FOLDERS = ['4qubits_train_qsvm_with_wine_2024-12-25', '12qubits_Define_Eval_QSVC_2024-12-18']
+
+
+def copy_legacy_folder(tmp_path, name):
+    folder = tmp_path / name
+    shutil.copytree(pathlib.Path(__file__).parent.parent / name, folder)
+    return folder
+
+
+def read_folder(folder):
+    return {path.name: path.read_bytes() for path in folder.iterdir()}
+
+
+def test_load_legacy_folder_needs_unresolved_funcs(tmp_path):
+    folder = copy_legacy_folder(tmp_path, LEGACY_FOLDERS[0])
+    with pytest.raises(ValueError, match='crossover_func'):
+        EEnvironment.load(str(folder), fitness)
+
+
+@pytest.mark.parametrize('name', LEGACY_FOLDERS)
+def test_load_legacy_folder_is_read_only(tmp_path, name):
+    folder = copy_legacy_folder(tmp_path, name)
+    files = read_folder(folder)
+    metadata = json.loads(files['metadata.json'])
+    env = load_env(folder)
+    assert read_folder(folder) == files
+    num_circuitss = len([file for file in files if file.startswith('circuit_') and file.endswith('_0.qpy')])
+    assert len(env.circuitss) == env.metadata.current_generation == min(len(metadata['fitnessss']), num_circuitss)
+    assert env.metadata.fitnessss == metadata['fitnessss']
+    assert env.metadata.best_fitnesss == metadata['best_fitnesss']
+    assert env.best_fitness == max(metadata['best_fitnesss'])
+    for i, circuits in enumerate(env.circuitss):
+        for j, circuit in enumerate(circuits):
+            assert utilities.circuit_key(circuit) == utilities.circuit_key(
+                utilities.load_circuit(str(folder / f'circuit_{i + 1}_{j}')))
+
+
+@pytest.mark.parametrize('convert', [False, True])
+def test_convert_legacy_folder(tmp_path, convert):
+    folder = copy_legacy_folder(tmp_path, LEGACY_FOLDERS[0])
+    env = EEnvironment.load(str(folder), fitness, convert=convert, selection_func=selection.elitist_selection, **FUNCS)
+    if not convert:
+        env.save()
+    converted = load_env(folder)
+    assert converted.archive is not None
+    assert_same_run(converted, env)
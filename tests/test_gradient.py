@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+import qiskit
+import qiskit.quantum_info as qi
+from qoop.core import ansatz, gradient, measure, state
+from qoop.backend import constant
+
+MODES = [constant.MeasureMode.THEORY.value, constant.MeasureMode.SIMULATE.value]
+ANSATZES = [ansatz.Wchain_zxz, ansatz.g2gnw, ansatz.zxz_WchainCNOT]
+
+
+def create_loss_circuit(create_ansatz, mode):
+    u = create_ansatz(3, 2)
+    if mode == constant.MeasureMode.THEORY.value:
+        return u.compose(state.haar_inverse(3))
+    return u
+
+
+@pytest.fixture
+def measure_mode(request, monkeypatch):
+    rng = np.random.default_rng(0)
+    psi = rng.normal(size=8) + 1j * rng.normal(size=8)
+    monkeypatch.setattr(constant, 'MEASURE_MODE', request.param)
+    monkeypatch.setattr(constant, 'PSI', psi / np.linalg.norm(psi))
+    return request.param
+
+
+@pytest.mark.parametrize('measure_mode', MODES, indirect=True)
+@pytest.mark.parametrize('create_ansatz', ANSATZES)
+def test_adjoint_matches_parameter_shift(measure_mode, create_ansatz):
+    qc = create_loss_circuit(create_ansatz, measure_mode)
+    thetas = np.random.default_rng(1).normal(size=qc.num_parameters)
+    assert np.allclose(gradient.grad_loss_adjoint(qc, thetas), gradient.grad_loss(qc, thetas), atol=1e-8)
+
+
+@pytest.mark.parametrize('measure_mode', MODES, indirect=True)
+def test_adjoint_matches_finite_differences(measure_mode):
+    qc = create_loss_circuit(ansatz.Wchain_zxz, measure_mode)
+    qc.crz(2 * qiskit.circuit.Parameter('crz') - 1, 0, 2)
+    qc.cp(qiskit.circuit.Parameter('cp'), 1, 0)
+    qc.crx(qiskit.circuit.Parameter('crx'), 2, 1)
+    thetas = np.random.default_rng(2).normal(size=qc.num_parameters)
+    shifts = 1e-6 * np.identity(qc.num_parameters)
+    expected = -(measure.measure_batch(qc, thetas + shifts) - measure.measure_batch(qc, thetas - shifts)) / 2e-6
+    assert np.allclose(gradient.grad_loss_adjoint(qc, thetas), expected, atol=1e-6)
+
+
+def fubini_study(qc, thetas):
+    """QFIM / 4 from qiskit state vectors and central differences"""
+    psi = qi.Statevector(qc.assign_parameters(thetas)).data
+    shifts = 1e-6 * np.identity(len(thetas))
+    dpsis = np.array([qi.Statevector(qc.assign_parameters(thetas + shift)).data
+                      - qi.Statevector(qc.assign_parameters(thetas - shift)).data for shift in shifts]) / 2e-6
+    overlaps = dpsis.conjugate() @ psi
+    return np.real(dpsis.conjugate() @ dpsis.T - np.outer(overlaps, overlaps.conjugate()))
+
+
+@pytest.mark.parametrize('create_ansatz', ANSATZES)
+def test_qng_matches_fubini_study_blocks(create_ansatz):
+    qc = create_ansatz(3, 2)
+    thetas = np.random.default_rng(3).normal(size=qc.num_parameters)
+    G = gradient.qng(qc, thetas)
+    expected = fubini_study(qc, thetas)
+    # Block-diagonal approximation: exact diagonal, other entries are 0 or exact
+    assert np.allclose(np.diag(G), np.diag(expected), atol=1e-8)
+    assert np.all(np.isclose(G, 0, atol=1e-12) | np.isclose(G, expected, atol=1e-8))
+
+
+def test_qng_single_layer_is_exact():
+    qc = qiskit.QuantumCircuit(3)
+    qc.h([0, 1, 2])
+    qc.cx(0, 1)
+    qc.cx(1, 2)
+    thetas = qiskit.circuit.ParameterVector('theta', 3)
+    qc.ry(thetas[0], 0)
+    qc.rx(2 * thetas[1], 1)
+    qc.rz(thetas[2], 2)
+    values = np.random.default_rng(4).normal(size=3)
+    assert np.allclose(gradient.qng(qc, values), fubini_study(qc, values), atol=1e-8)
+
+
+def test_qng_ignores_final_measurements():
+    qc = ansatz.zxz_WchainCNOT(3, 1)
+    thetas = np.random.default_rng(5).normal(size=qc.num_parameters)
+    measured = qc.copy()
+    measured.measure_all()
+    assert np.allclose(gradient.qng(measured, thetas), gradient.qng(qc, thetas))
+
+
+@pytest.mark.parametrize('create_ansatz', ANSATZES)
+def test_qng_hessian_matches_fubini_study(create_ansatz):
+    qc = create_ansatz(3, 1)
+    thetas = np.random.default_rng(6).normal(size=qc.num_parameters)
+    G = gradient.qng_hessian(qc, thetas, batch_size=7)
+    assert np.array_equal(G, G.T)
+    assert np.allclose(G, fubini_study(qc, thetas), atol=1e-6)
+
+
+def test_qng_hessian_unsupported_circuit():
+    qc = qiskit.QuantumCircuit(2)
+    a, b = qiskit.circuit.Parameter('a'), qiskit.circuit.Parameter('b')
+    qc.rx(a * a, 0)
+    qc.cx(0, 1)
+    qc.ry(b, 1)
+    thetas = np.array([0.3, 0.2])
+    # Finite differences with alpha = 0.01 on a non-linear angle
+    assert np.allclose(gradient.qng_hessian(qc, thetas), fubini_study(qc, thetas), atol=1e-3)
+
+
+def test_parameter_shift_needs_a_gate_per_parameter():
+    qc = ansatz.Wchain_zxz(3, 1)
+    with pytest.raises(ValueError):
+        gradient.grad_loss(qc, np.zeros(qc.num_parameters + 1))
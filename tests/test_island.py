@@ -0,0 +1,90 @@
+import random
+import contextlib
+import io
+import itertools
+import queue
+import numpy as np
+import qiskit.quantum_info as qi
+from qoop.evolution.environment_synthesis import MetadataSynthesis
+from qoop.evolution.environment import EEnvironment
+from qoop.evolution import crossover, divider, generator, mutate, normalizer, island
+from qoop.backend import constant, utilities
+
+
+def create_env(fitness_func, threshold_func, num_generation=4, seed=3):
+    random.seed(seed)
+    np.random.seed(seed)
+    metadata = MetadataSynthesis(num_qubits=4, num_cnot=3, num_rx=1, num_ry=1, num_rz=2, depth=4,
+                                 num_circuit=4, num_generation=num_generation, prob_mutate=0.2)
+    return EEnvironment(
+        metadata=metadata, fitness_func=fitness_func, generator_func=generator.by_num_rotations_and_cnot,
+        crossover_func=crossover.onepoint(divider.by_num_rotation_gate(2), normalizer.by_num_rotation_gate(4)),
+        mutate_func=mutate.bitflip_mutate_with_normalizer(
+            constant.operations_with_rotations, normalizer_func=normalizer.by_num_rotation_gate(4)),
+        threshold_func=threshold_func)
+
+
+class Queue(queue.Queue):
+    """In-process stand-in for the multiprocessing queues of IslandModel"""
+
+    def cancel_join_thread(self):
+        return
+
+
+def fitness(qc):
+    return float(np.abs(qi.Statevector(qc.assign_parameters(np.ones(qc.num_parameters))).data[0])**2)
+
+
+def test_threshold_at_migration_interval_stops_the_island():
+    counter = itertools.count(1)
+
+    def fitness(qc):
+        # Every new circuit scores higher than the previous ones
+        return float(next(counter))
+
+    # Reached by the first circuit of generation 2, the last generation of the first interval
+    env = create_env(fitness, lambda fitness: fitness > 4)
+    inbox, outbox, results = Queue(), Queue(), Queue()
+    immigrant = create_env(fitness, lambda fitness: False).generator_func(env.metadata)
+    inbox.put([(utilities.circuit_to_bytes(immigrant), 100.0)])
+    with contextlib.redirect_stdout(io.StringIO()):
+        island._run_island(0, env, 0, 2, 1, inbox, outbox, results, 'serial', False)
+    index, best_fitness, _, best_fitnesss, error = results.get_nowait()
+    assert error is None
+    assert env.is_finished
+    assert env.metadata.current_generation == 2
+    assert best_fitness == best_fitnesss[-1] == env.best_fitness
+    # No migration: nothing is sent and the evaluated population is kept
+    assert outbox.empty() and not inbox.empty()
+    assert env.circuitss[-1] is env.circuits
+    assert [env.lookup_fitness(utilities.circuit_key(circuit)) for circuit in env.circuits] \
+        == env.metadata.fitnessss[-1]
+
+
+def test_ring_migration():
+    envs = [create_env(fitness, lambda fitness: False, num_generation=2, seed=seed) for seed in range(3)]
+    queues = [Queue() for _ in envs]
+    results = Queue()
+    # Islands run one after the other, each one finds the migrants of the previous island in its inbox
+    for index, env in enumerate(envs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            island._run_island(index, env, index, 1, 1, queues[index], queues[(index + 1) % len(envs)],
+                               results, 'serial', False)
+    for sender, receiver in zip(envs, envs[1:]):
+        migrant = sender.best_circuits[0]
+        # Migrants replace the last offspring of the population scored at generation 2
+        assert utilities.circuit_key(receiver.circuitss[0][-1]) == utilities.circuit_key(migrant)
+        assert receiver.lookup_fitness(utilities.circuit_key(migrant)) == sender.metadata.best_fitnesss[0]
+    # The last island sends to the first one, which already ended
+    [(data, best_fitness)] = queues[0].get_nowait()
+    assert utilities.circuit_key(utilities.circuit_from_bytes(data)) == utilities.circuit_key(envs[2].best_circuits[0])
+    assert [results.get_nowait()[4] for _ in envs] == [None] * len(envs)
+
+
+def test_island_model():
+    envs = [create_env(fitness, lambda fitness: False, num_generation=2, seed=seed) for seed in range(2)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = island.IslandModel(envs, migration_interval=1).evol()
+    assert len(model.best_fitnessss) == 2 and all(len(best_fitnesss) == 2 for best_fitnesss in model.best_fitnessss)
+    assert model.best_fitness == max(model.best_fitnesss) == max(map(max, model.best_fitnessss))
+    assert np.isclose(fitness(model.best_circuit), model.best_fitness)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import scipy
+from qoop.core import optimizer
+from qoop.backend import constant
+
+
+def metric(eigenvalues, seed):
+    eigenvectors = scipy.stats.ortho_group.rvs(len(eigenvalues), random_state=seed)
+    return (eigenvectors * eigenvalues) @ eigenvectors.T, eigenvectors
+
+
+def test_solve_metric_cholesky_matches_inverse_qfim():
+    G, _ = metric([2, 1, 0.5, 0.1], 0)
+    grad = np.random.default_rng(0).normal(size=4)
+    regularized = G + constant.QNG_REGULARIZATION * np.identity(4)
+    assert np.allclose(optimizer.solve_metric(G, grad), optimizer._inverse_qfim(regularized) @ grad)
+    assert np.allclose(optimizer.solve_metric(G, grad, regularization=0), optimizer._inverse_qfim(G) @ grad)
+
+
+def test_solve_metric_eigh_fallback():
+    # A negative eigenvalue, ex: from finite differences, makes the Cholesky factorization fail
+    G, eigenvectors = metric([2, 1, 0.5, -1], 1)
+    grad = np.random.default_rng(1).normal(size=4)
+    with pytest.raises(np.linalg.LinAlgError):
+        scipy.linalg.cho_factor(G + constant.QNG_REGULARIZATION * np.identity(4))
+    # Same as inverse_qfim on the positive part of the regularized metric
+    positive, _ = metric([2, 1, 0.5, 0], 1)
+    kept = eigenvectors[:, :3]
+    expected = kept @ kept.T @ optimizer._inverse_qfim(
+        positive + constant.QNG_REGULARIZATION * np.identity(4)) @ grad
+    assert np.allclose(optimizer.solve_metric(G, grad), expected)
+
+
+def test_adam_matches_adam_function_and_reset():
+    rng = np.random.default_rng(2)
+    thetas, grads = rng.normal(size=3), rng.normal(size=(3, 3))
+    adam = optimizer.Adam()
+    expected, m, v = thetas.copy(), np.zeros(3), np.zeros(3)
+    values = thetas
+    for iteration, grad in enumerate(grads):
+        values = adam.step(values, grad)
+        expected = optimizer.adam(expected, m, v, iteration, grad)
+        assert np.allclose(values, expected)
+    adam.reset()
+    assert adam.iteration == 0 and adam.m is None and adam.v is None
+    assert np.allclose(adam.step(thetas, grads[0]), optimizer.Adam().step(thetas, grads[0]))
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import qiskit
+import qiskit.quantum_info as qi
+from qiskit.circuit import ParameterVector
+from qoop.core import ansatz, gradient, measure, simulator
+from qoop.backend import constant
+
+
+def random_circuit(num_qubits, num_gates, seed):
+    rng = np.random.default_rng(seed)
+    thetas = ParameterVector('theta', 6)
+    qc = qiskit.QuantumCircuit(num_qubits)
+    for k in range(num_gates):
+        a, b = [int(qubit) for qubit in rng.choice(num_qubits, 2, replace=False)]
+        theta = thetas[k % len(thetas)]
+        [lambda: qc.h(a), lambda: qc.x(a), lambda: qc.y(a), lambda: qc.z(a),
+         lambda: qc.s(a), lambda: qc.sdg(a), lambda: qc.t(a), lambda: qc.tdg(a),
+         lambda: qc.rx(theta, a), lambda: qc.ry(2 * theta + 1, a), lambda: qc.rz(theta, a), lambda: qc.p(theta, a),
+         lambda: qc.cx(a, b), lambda: qc.cy(a, b), lambda: qc.cz(a, b), lambda: qc.ch(a, b),
+         lambda: qc.crx(theta, a, b), lambda: qc.cry(theta, a, b), lambda: qc.crz(-theta, a, b), lambda: qc.cp(theta, a, b),
+         lambda: qc.swap(a, b), lambda: qc.u(0.3, 0.2, 0.1, a)][rng.integers(0, 22)]()
+    qc.barrier()
+    qc.unitary(qi.random_unitary(4, seed=seed), [0, num_qubits - 1])
+    return qc
+
+
+def reference_statevectors(qc, thetass):
+    return np.array([qi.Statevector(qc.assign_parameters(thetas)).data for thetas in thetass])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_run_matches_statevector(seed):
+    qc = random_circuit(4, 40, seed)
+    thetass = np.random.default_rng(seed).normal(size=(3, qc.num_parameters))
+    assert np.allclose(simulator.statevectors(qc, thetass), reference_statevectors(qc, thetass), atol=1e-10)
+
+
+@pytest.mark.parametrize('create_circuit', [ansatz.Wchain_zxz, ansatz.g2gnw, ansatz.zxz_WchainCNOT])
+def test_ansatz_matches_statevector(create_circuit):
+    qc = create_circuit(3, 2)
+    thetass = np.random.default_rng(0).normal(size=(2, qc.num_parameters))
+    assert np.allclose(simulator.statevectors(qc, thetass), reference_statevectors(qc, thetass), atol=1e-10)
+
+
+def test_inverse_undoes_run():
+    qc = random_circuit(3, 30, 1)
+    program = simulator.get_program(qc)
+    thetas = np.random.default_rng(1).normal(size=(1, qc.num_parameters))
+    states = program.run(thetas)
+    assert np.allclose(program.inverse().run(thetas, states=states)[0, 0], 1)
+
+
+def test_unsupported_circuit():
+    qc = qiskit.QuantumCircuit(1, 1)
+    qc.h(0)
+    qc.measure(0, 0)
+    assert simulator.get_program(qc) is None
+
+
+def test_program_cache_follows_circuit_changes():
+    qc = ansatz.Wchain_zxz(3, 1)
+    program = simulator.get_program(qc)
+    assert simulator.get_program(qc) is program
+    assert simulator.get_program(qc.copy()) is program
+    qc.h(0)
+    thetas = np.zeros((1, qc.num_parameters))
+    assert np.allclose(simulator.statevectors(qc, thetas), reference_statevectors(qc, thetas))
+
+
+def test_wrong_number_of_parameters():
+    qc = ansatz.Wchain_zxz(3, 1)
+    with pytest.raises(ValueError):
+        simulator.get_program(qc).run(np.zeros(qc.num_parameters + 1))
+
+
+@pytest.mark.parametrize('global_phase', ['constant', 'parameterized'])
+def test_global_phase(monkeypatch, global_phase):
+    qc = ansatz.Wchain_zxz(3, 1)
+    qc.global_phase = np.pi / 3 if global_phase == 'constant' else 2 * qc.parameters[0] + 0.5
+    thetas = np.random.default_rng(2).normal(size=(1, qc.num_parameters))
+    assert np.allclose(simulator.statevectors(qc, thetas), reference_statevectors(qc, thetas), atol=1e-10)
+    psi = np.random.default_rng(3).normal(size=8) + 1j
+    monkeypatch.setattr(constant, 'MEASURE_MODE', constant.MeasureMode.SIMULATE.value)
+    monkeypatch.setattr(constant, 'PSI', psi / np.linalg.norm(psi))
+    expected = np.real(np.vdot(constant.PSI, reference_statevectors(qc, thetas)[0]))**2
+    assert np.isclose(measure.measure(qc, thetas[0]), expected)
+    shifts = 1e-6 * np.identity(qc.num_parameters)
+    differences = -(measure.measure_batch(qc, thetas[0] + shifts) - measure.measure_batch(qc, thetas[0] - shifts)) / 2e-6
+    assert np.allclose(gradient.grad_loss_adjoint(qc, thetas[0]), differences, atol=1e-6)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from qoop.evolution.environment_synthesis import MetadataSynthesis
+from qoop.evolution.environment import EEnvironment
+from qoop.evolution.store import SQLiteFitnessStore, dataset_fingerprint
+
+
+def test_round_trip(tmp_path):
+    fingerprint = dataset_fingerprint(np.arange(4))
+    SQLiteFitnessStore(str(tmp_path / 'fitness.sqlite'), fingerprint).put('key', 'fitness', 0.5)
+    store = SQLiteFitnessStore(str(tmp_path / 'fitness.sqlite'), fingerprint)
+    assert store.get('key', 'fitness') == 0.5
+    assert store.get('key', 'other_fitness') is None
+    assert store.get('other_key', 'fitness') is None
+
+
+def test_fingerprint_mismatch(tmp_path):
+    path = str(tmp_path / 'fitness.sqlite')
+    store = SQLiteFitnessStore(path)
+    store.attach({'X_train': np.arange(4), 'y_train': np.zeros(4)})
+    store.put('key', 'fitness', 0.5)
+    other = SQLiteFitnessStore(path)
+    other.attach({'X_train': np.arange(4), 'y_train': np.ones(4)})
+    assert other.get('key', 'fitness') is None
+    with pytest.raises(ValueError):
+        SQLiteFitnessStore(path, store.fingerprint).attach({'X_train': np.arange(5), 'y_train': np.zeros(5)})
+
+
+def test_no_fingerprint(tmp_path):
+    store = SQLiteFitnessStore(str(tmp_path / 'fitness.sqlite'))
+    with pytest.raises(ValueError):
+        store.attach({})
+    with pytest.raises(ValueError):
+        store.put('key', 'fitness', 0.5)
+    with pytest.raises(ValueError):
+        store.get('key', 'fitness')
+
+
+def test_environment_without_dataset_needs_a_fingerprint(tmp_path):
+    metadata = MetadataSynthesis(num_qubits=2, num_cnot=1, num_rx=1, num_ry=0, num_rz=0, depth=2,
+                                 num_circuit=2, num_generation=1)
+    with pytest.raises(ValueError):
+        EEnvironment(metadata=metadata, fitness_func=len, fitness_store=SQLiteFitnessStore(str(tmp_path / 'a.sqlite')))
+    store = SQLiteFitnessStore(str(tmp_path / 'b.sqlite'), fingerprint='compilation')
+    env = EEnvironment(metadata=metadata, fitness_func=len, fitness_store=store)
+    env.remember_fitness('key', 0.5)
+    assert EEnvironment(metadata=metadata, fitness_func=len, fitness_store=store).lookup_fitness('key') == 0.5